@@ -0,0 +1,106 @@
+'''
+Benchmark for walking the vault when building the file tree (Index): rglob with a per-file exclusion check, versus
+the scandir walker that skips excluded folders as a whole (Index.scan_folder()),
+matching the paths against the compiled exclude_glob patterns (lib.PathMatcher).
+
+Usage (from the root of the repo):
+    python ci/benchmarks/index_benchmark.py [--files 200000] [--excluded-share 0.3] [--vault /tmp/some_folder]
+
+A synthetic vault is generated with --files files, of which --excluded-share are put in excluded folders
+(.git, node_modules, .trash). When --vault is given, the vault is kept there so that it can be reused by the next run.
+'''
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.parent.as_posix())
+from obsidianhtml.core.Index import Index
+from obsidianhtml.lib import PathMatcher
+
+EXCLUDE_GLOB = ['.git', 'node_modules', '.trash']
+FILES_PER_FOLDER = 100
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    duration = time.perf_counter() - start
+    print(f'{label:<40}{duration:8.3f}s')
+    return result
+
+def create_vault(root, files, excluded_share):
+    ''' Creates folders with FILES_PER_FOLDER notes each, a share of them under the excluded folders '''
+    excluded_files = int(files * excluded_share)
+    for i in range(0, files, FILES_PER_FOLDER):
+        if i < excluded_files:
+            folder = root.joinpath(EXCLUDE_GLOB[i % len(EXCLUDE_GLOB)], f'sub{i // 1000}', f'folder{i}')
+        else:
+            folder = root.joinpath(f'area{i // 10000}', f'topic{i // 1000}', f'folder{i}')
+        folder.mkdir(parents=True, exist_ok=True)
+        for j in range(i, min(i + FILES_PER_FOLDER, files)):
+            folder.joinpath(f'note {j}.md').write_text(f'# Note {j}\n')
+
+def glob_excluded_folders(root, exclude_glob):
+    ''' How the excluded folders were found before: every exclude_glob pattern expanded with glob.glob() '''
+    excluded_folders = []
+    for pattern in exclude_glob:
+        for path in glob.glob(root.joinpath('**', pattern).as_posix(), recursive=True):
+            excluded_folders.append(Path(path).resolve())
+    return excluded_folders
+
+def walk_with_rglob(root, excluded_folders):
+    ''' The file tree as it was built before: every path is checked against every excluded folder '''
+    found = []
+    for path in root.rglob('*'):
+        if path.is_dir():
+            continue
+        if any(path.resolve().is_relative_to(folder) for folder in excluded_folders):
+            continue
+        os.path.getmtime(path)
+        found.append(path)
+    return found
+
+def walk_with_scandir(root):
+    # Index.scan_folder() only needs the exclude matcher and the config (for verbose printout)
+    index = Index.__new__(Index)
+    index.pb = SimpleNamespace(gc=lambda path, cached=False: False)
+    index.input_folder_root = root
+    index.exclude_matcher = PathMatcher(EXCLUDE_GLOB)
+    return [path for path, stat_result in index.scan_folder(root)]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=200000)
+    parser.add_argument('--excluded-share', type=float, default=0.3, help='share of the files that are in excluded folders')
+    parser.add_argument('--vault', default=None, help='folder to create the vault in (created when it does not exist yet)')
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.vault is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        root = Path(tmpdir.name)
+    else:
+        root = Path(args.vault)
+    root = root.resolve()
+
+    if not root.joinpath('area0').exists() and not root.joinpath('.git').exists():
+        timed(f'creating vault with {args.files} files', lambda: create_vault(root, args.files, args.excluded_share))
+
+    before = timed('glob + rglob, exclusion check per file', lambda: walk_with_rglob(root, glob_excluded_folders(root, EXCLUDE_GLOB)))
+    after = timed('scandir, excluded folders skipped', lambda: walk_with_scandir(root))
+
+    if before != after:
+        print('ERROR: the walkers found different files')
+        exit(1)
+    print(f'Found {len(after)} files')
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+'''
+Micro-benchmark for converting notes to html with a new markdown instance per note, versus reusing one instance.
+
+Usage (from the root of the repo):
+    python ci/benchmarks/markdown_engine_benchmark.py [--vault ci/test_vault] [--rounds 5]
+
+The notes of the vault are converted as-is (without the obsidian-specific preprocessing), --rounds times each.
+The per-note overhead is the difference between the two timings, divided by the number of conversions.
+'''
+import sys
+import time
+import argparse
+
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.parent.as_posix())
+from obsidianhtml.controller.ConvertVault import get_markdown_engine
+
+def timed(label, func):
+    start = time.perf_counter()
+    func()
+    duration = time.perf_counter() - start
+    print(f'{label:<30}{duration:8.3f}s')
+    return duration
+
+def convert_with_new_instance(pb, pages):
+    for page in pages:
+        pb.markdown_engine = None
+        get_markdown_engine(pb).convert(page)
+
+def convert_with_reused_instance(pb, pages):
+    pb.markdown_engine = None
+    for page in pages:
+        md_engine = get_markdown_engine(pb)
+        md_engine.reset()
+        md_engine.convert(page)
+
+def main():
+    root = Path(__file__).resolve().parent.parent
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vault', default=root.joinpath('test_vault').as_posix())
+    parser.add_argument('--rounds', type=int, default=5, help='number of times every note is converted')
+    args = parser.parse_args()
+
+    pages = [x.read_text(encoding='utf-8') for x in sorted(Path(args.vault).rglob('*.md'))] * args.rounds
+    
+    # all optional extensions disabled
+    pb = SimpleNamespace(gc=lambda path, cached=False: False, markdown_engine=None)
+
+    print(f'Converting {len(pages)} notes')
+    before = timed('new instance per note', lambda: convert_with_new_instance(pb, pages))
+    after = timed('reused instance', lambda: convert_with_reused_instance(pb, pages))
+    print(f'Per-note overhead removed: {(before - after) / len(pages) * 1000:.2f}ms')
+
+if __name__ == '__main__':
+    main()
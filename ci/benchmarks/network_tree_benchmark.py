@@ -0,0 +1,65 @@
+'''
+Micro-benchmark for building the graph (NetworkTree) of a large synthetic vault.
+
+Usage (from the root of the repo):
+    python ci/benchmarks/network_tree_benchmark.py [--nodes 100000] [--links 5]
+
+Every node links to --links other nodes. Every node is added twice and every link is added twice, 
+because notes are revisited (inclusions, notes that are linked to from multiple notes) during a real conversion.
+'''
+import sys
+import time
+import random
+import argparse
+
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.parent.as_posix())
+from obsidianhtml.core.NetworkTree import NetworkTree
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f'{label:<30}{time.perf_counter() - start:8.3f}s')
+    return result
+
+def build_graph(tree, node_count, links_per_node, seed):
+    rnd = random.Random(seed)
+    for _ in range(2):
+        for i in range(node_count):
+            node = tree.NewNode()
+            node['id'] = f'note {i}'
+            node['metadata'] = {'tags': ['benchmark']}
+            tree.add_node(node)
+
+    for _ in range(2):
+        rnd.seed(seed)
+        for i in range(node_count):
+            for _ in range(links_per_node):
+                link = tree.NewLink()
+                link['source'] = f'note {i}'
+                link['target'] = f'note {rnd.randrange(node_count)}'
+                link['type'] = 'reference'
+                tree.AddLink(link)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=100000)
+    parser.add_argument('--links', type=int, default=5, help='number of links per node')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    index = SimpleNamespace(pb=SimpleNamespace(verbose=False))
+    tree = NetworkTree(index)
+
+    print(f'Synthetic graph: {args.nodes} nodes, {args.links} links per node')
+    timed('add_node + AddLink', lambda: build_graph(tree, args.nodes, args.links, args.seed))
+    timed('compile_node_lookup', tree.compile_node_lookup)
+    timed('backlinks (all nodes)', lambda: [tree.get_backlinks(n['id']) for n in tree.tree['nodes']])
+    timed('AddCrosslinks', tree.AddCrosslinks)
+    timed('OutputJson', tree.OutputJson)
+    print(f"Result: {len(tree.tree['nodes'])} nodes, {len(tree.tree['links'])} links")
+
+if __name__ == '__main__':
+    main()
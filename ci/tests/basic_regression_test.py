@@ -7,6 +7,11 @@ import yaml
 import subprocess
 import time
 import shutil
+import gzip
+import tempfile
+import threading
+import http.client
+import http.server
 
 # web stuff
 from bs4 import BeautifulSoup
@@ -154,6 +159,15 @@ class TestDefaultModeMdOnly(TestDefaultMode):
         convert_vault(USE_PIP_INSTALL)
 
 
+class TestFusedPipeline(TestDefaultMode):
+    """Same as test default mode, but hand the notes to the html conversion in memory"""
+    testcase_name = "FusedPipeline"
+    testcase_custom_config_values = [
+        ('toggles/features/rss/enabled', True), 
+        ('toggles/fused_pipeline', True), 
+    ]  
+
+
 class TestHtmlPrefixMode(ModeTemplate):
     """Configure a HTML prefix"""
     testcase_name = "HtmlPrefix"
@@ -291,6 +305,28 @@ class TestMisc(ModeTemplate):
         self.assertEqual(div.text, content, msg=f"innerhtml of custom div was expected to be \n\t'{content}'\n but was \n\t'{div.text}'")
 
 
+class TestIncrementalBuild(ModeTemplate):
+    """Build twice with toggles/incremental_build, the second build should leave the unchanged pages alone"""
+    testcase_name = "IncrementalBuild"
+    testcase_custom_config_values = [
+        ('toggles/incremental_build', True),
+        ('build_cache_folder_path_str', 'tmp/build_cache'),
+    ]
+
+    def test_unchanged_pages_are_left_alone(self):
+        self.scribe('second build should not rewrite unchanged html pages')
+        index_path = get_paths()['html_output_folder'].joinpath('index.html')
+        mtime = index_path.stat().st_mtime_ns
+
+        time.sleep(0.1)
+        convert_vault(self.USE_PIP_INSTALL)
+        self.assertEqual(index_path.stat().st_mtime_ns, mtime, msg="index.html was rewritten by the second build")
+
+        self.scribe('pages should still be served after the second build')
+        next_url = self.index_html_should_exist(path='index.html')
+        self.obsidian_type_links_should_work(next_url)
+
+
 class TestAFiltering1(ModeTemplate):
     testcase_name = "FilteringTests"
     testcase_custom_config_values = [
@@ -322,6 +358,220 @@ class TestAFiltering2(ModeTemplate):
         self.assertEqual(len(issues), 0, msg=f"Issues found with filtering\n{actual_files}\n{yaml.dump(issues)}")
 
 
+class TestMaxNoteDepth(ModeTemplate):
+    testcase_name = "MaxNoteDepth"
+    testcase_custom_config_values = [
+        ('obsidian_entrypoint_path_str', 'ci/test_vault/note_depth/depth_home.md'),
+        ('included_folders', ['note_depth']),
+        ('max_note_depth', 2),
+        ('copy_vault_to_tempdir', False),
+    ]
+    def test_jobs_give_the_same_output(self):
+        self.scribe('Only convert the notes within max_note_depth')
+        issues, actual_files = check_md_output('md/note_depth', ['depth_b.md', 'depth_c.md'])
+        self.assertEqual(len(issues), 0, msg=f"Issues found with max_note_depth\n{actual_files}\n{yaml.dump(issues)}")
+
+        self.scribe('Converting with multiple processes should convert the same notes')
+        customize_default_config(self.testcase_custom_config_values + [('jobs', 4)])
+        convert_vault(self.USE_PIP_INSTALL)
+        issues, actual_files = check_md_output('md/note_depth', ['depth_b.md', 'depth_c.md'])
+        self.assertEqual(len(issues), 0, msg=f"Issues found with max_note_depth and --jobs 4\n{actual_files}\n{yaml.dump(issues)}")
+
+
+class TestServe(ModeTemplate):
+    """Serve the built test vault with the handler of `obsidianhtml serve`"""
+    testcase_name = "Serve"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        from obsidianhtml.controller.Serve import get_handler
+
+        # precompressed variants of index.html (the .br file does not have to be valid brotli, it is only sent as is)
+        html_output_folder = get_paths()['html_output_folder']
+        cls.index_bytes = html_output_folder.joinpath('index.html').read_bytes()
+        cls.gz_bytes = gzip.compress(cls.index_bytes)
+        html_output_folder.joinpath('index.html.gz').write_bytes(cls.gz_bytes)
+        html_output_folder.joinpath('index.html.br').write_bytes(b'brotli placeholder')
+
+        cls.httpd = http.server.ThreadingHTTPServer(('localhost', 0), get_handler(html_output_folder))
+        cls.httpd.daemon_threads = True
+        threading.Thread(target=cls.httpd.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        super().tearDownClass()
+
+    def request(self, path, headers=None, conn=None):
+        if conn is None:
+            conn = http.client.HTTPConnection('localhost', self.httpd.server_address[1], timeout=10)
+        conn.request('GET', path, headers=headers or {})
+        response = conn.getresponse()
+        return response, response.read()
+
+    def test_etag(self):
+        self.scribe('a request with a matching If-None-Match should get a 304')
+        response, body = self.request('/index.html')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, self.index_bytes)
+        etag = response.getheader('ETag')
+        self.assertIsNotNone(etag)
+
+        response, body = self.request('/index.html', {'If-None-Match': etag})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(body, b'')
+
+        response, body = self.request('/index.html', {'If-None-Match': '"other"'})
+        self.assertEqual(response.status, 200)
+
+    def test_range(self):
+        self.scribe('range requests should get the requested bytes')
+        size = len(self.index_bytes)
+
+        response, body = self.request('/index.html', {'Range': 'bytes=0-9'})
+        self.assertEqual(response.status, 206)
+        self.assertEqual(body, self.index_bytes[:10])
+        self.assertEqual(response.getheader('Content-Range'), f'bytes 0-9/{size}')
+
+        response, body = self.request('/index.html', {'Range': 'bytes=-5'})
+        self.assertEqual(response.status, 206)
+        self.assertEqual(body, self.index_bytes[-5:])
+        self.assertEqual(response.getheader('Content-Range'), f'bytes {size-5}-{size-1}/{size}')
+
+        response, body = self.request('/index.html', {'Range': f'bytes={size}-'})
+        self.assertEqual(response.status, 416)
+        self.assertEqual(response.getheader('Content-Range'), f'bytes */{size}')
+
+        self.scribe('If-Range should only allow the range when the ETag matches')
+        etag = self.request('/index.html')[0].getheader('ETag')
+        response, body = self.request('/index.html', {'Range': 'bytes=0-9', 'If-Range': etag})
+        self.assertEqual(response.status, 206)
+        response, body = self.request('/index.html', {'Range': 'bytes=0-9', 'If-Range': '"other"'})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, self.index_bytes)
+
+    def test_precompressed(self):
+        self.scribe('precompressed files should be sent when the client accepts them')
+        response, body = self.request('/index.html', {'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.getheader('Content-Encoding'), 'gzip')
+        self.assertEqual(response.getheader('Vary'), 'Accept-Encoding')
+        self.assertEqual(body, self.gz_bytes)
+
+        response, body = self.request('/index.html', {'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.getheader('Content-Encoding'), 'br')
+        self.assertEqual(body, b'brotli placeholder')
+
+        response, body = self.request('/index.html', {'Accept-Encoding': 'br;q=0, gzip;q=0'})
+        self.assertIsNone(response.getheader('Content-Encoding'))
+        self.assertEqual(response.getheader('Vary'), 'Accept-Encoding')
+        self.assertEqual(body, self.index_bytes)
+
+    def test_keep_alive(self):
+        self.scribe('multiple requests should be served over the same connection')
+        conn = http.client.HTTPConnection('localhost', self.httpd.server_address[1], timeout=10)
+        response, body = self.request('/index.html', conn=conn)
+        self.assertEqual(response.version, 11)
+        self.assertFalse(response.will_close)
+        sock = conn.sock
+
+        response, body = self.request('/index.html', {'Range': 'bytes=0-9'}, conn=conn)
+        self.assertEqual(body, self.index_bytes[:10])
+        self.assertIs(conn.sock, sock)
+        conn.close()
+
+
+class FakePicknickBasket:
+    """Only provides the config values that the vault copy functions use"""
+    def __init__(self, config):
+        self.config = config
+
+    def gc(self, path, cached=False):
+        return self.config[path]
+
+
+class TestWatch(unittest.TestCase):
+    """FileWatcher and SyncTemporaryCopy, as used by the watch command"""
+
+    def setUp(self):
+        self.source = tempfile.TemporaryDirectory()
+        self.root = Path(self.source.name).resolve()
+        self.root.joinpath('note.md').write_text('note')
+        self.root.joinpath('out').mkdir()
+
+    def tearDown(self):
+        self.source.cleanup()
+
+    def ignore(self, path):
+        return path.name == 'out' or path.name.endswith('.ignored')
+
+    def check_watcher(self, use_inotify):
+        from obsidianhtml.core.FileWatcher import FileWatcher
+
+        watcher = FileWatcher(self.root, ignore=self.ignore, interval=0.1, use_inotify=use_inotify)
+        if use_inotify and watcher.method != 'inotify':
+            self.skipTest('inotify is not available')
+
+        # only the change to the watched file should be reported, changes to ignored files should not wake the watcher
+        def write_files():
+            self.root.joinpath('file.ignored').write_text('ignored')
+            self.root.joinpath('out/page.html').write_text('output')
+            time.sleep(0.5)
+            self.root.joinpath('note.md').write_text('changed')
+        writer = threading.Thread(target=write_files)
+        writer.start()
+
+        changed = watcher.wait_for_changes(debounce=0.2)
+        writer.join()
+        self.assertEqual(changed, {self.root.joinpath('note.md')})
+
+    def test_watcher_inotify(self):
+        self.check_watcher(use_inotify=True)
+
+    def test_watcher_polling(self):
+        self.check_watcher(use_inotify=False)
+
+    def test_sync_temporary_copy(self):
+        from obsidianhtml.features.CopyVault import CreateTemporaryCopy, SyncTemporaryCopy
+
+        pb = FakePicknickBasket({
+            'toggles/verbose_printout': False,
+            'copy_vault_to_tempdir_method': 'shutil',
+            'copy_vault_to_tempdir_follow_copy': False,
+            'exclude_glob': ['out'],
+        })
+        self.root.joinpath('removed.md').write_text('removed')
+        self.root.joinpath('out/page.html').write_text('output')
+
+        tmpdir = CreateTemporaryCopy(self.root, pb)
+        copy = Path(tmpdir.name)
+        self.assertEqual(copy.joinpath('note.md').read_text(), 'note')
+        self.assertFalse(copy.joinpath('out').exists())
+
+        # add, modify, delete
+        self.root.joinpath('sub').mkdir()
+        self.root.joinpath('sub/added.md').write_text('added')
+        self.root.joinpath('note.md').write_text('changed')
+        self.root.joinpath('removed.md').unlink()
+        changed = {self.root.joinpath('sub'), self.root.joinpath('note.md'), self.root.joinpath('removed.md')}
+
+        tmpdir = SyncTemporaryCopy(self.root, tmpdir, changed, self.ignore, pb)
+        copy = Path(tmpdir.name)
+        self.assertEqual(copy.joinpath('sub/added.md').read_text(), 'added')
+        self.assertEqual(copy.joinpath('note.md').read_text(), 'changed')
+        self.assertFalse(copy.joinpath('removed.md').exists())
+
+        # when the watcher does not know what changed, it reports the root folder, the copy should be made again
+        self.root.joinpath('sub/added.md').unlink()
+        new_tmpdir = SyncTemporaryCopy(self.root, tmpdir, {self.root}, self.ignore, pb)
+        self.assertFalse(Path(new_tmpdir.name).joinpath('sub/added.md').exists())
+        self.assertEqual(Path(new_tmpdir.name).joinpath('note.md').read_text(), 'changed')
+        self.assertFalse(copy.exists())
+        new_tmpdir.cleanup()
+
+
 if __name__ == '__main__':
     # Args
     run_setup = False
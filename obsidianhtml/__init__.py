@@ -9,6 +9,7 @@ from .controller.ConvertVault import ConvertVault
 from .controller.Run import Run
 from .controller.Export import RunExport
 from .controller.Serve import ServeDir
+from .controller.Watch import Watch
 from .features.EmbeddedSearch import CliEmbeddedSearch
 
 
@@ -28,6 +29,8 @@ def main():
 
     if command == 'convert':
         ConvertVault()
+    elif command == 'watch':
+        Watch()
     elif command == 'run':
         Run()
     elif command == 'export':
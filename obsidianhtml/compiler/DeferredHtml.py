@@ -0,0 +1,86 @@
+import regex as re
+
+from pathlib import Path
+
+'''
+Some parts of a page can only be compiled once all the notes have been converted, such as the backlinks,
+the tags footer, the breadcrumbs, the side panes and embedded search results.
+
+The first pass leaves placeholders ("slots") for these parts in the html. Instead of writing this html to disk
+and reading it back in for the second pass, the html is kept here, split up into static segments and slots.
+In the second pass every slot is filled in (see fill_deferred_html) and the page is written exactly once.
+'''
+
+# Every placeholder that the second pass fills in. Each alternative has its own group, see SLOT_NAMES.
+SLOT_PATTERN = re.compile(
+    r'\{(left_pane|right_pane)\}'
+    r'|\{_obsidian_html_(backlinks|tags_footer|breadcrumbs)_pattern_\}'
+    r'|\{_obsidian_html_node_id_pattern_:(.*?)\}'
+    r'|<code>\{_obsidian_pattern_tag_(.*?)\}</code>'
+    r'|<p>\{_obsidian_html_query:(.*?) \}</p>'
+)
+SLOT_NAMES = {3: 'node_id', 4: 'tag', 5: 'query'}
+
+def split_html(html):
+    ''' Splits the html into a list of static segments (str) and slots (tuple of name, argument, original text) '''
+    segments = []
+    pos = 0
+    for m in SLOT_PATTERN.finditer(html):
+        if m.start() > pos:
+            segments.append(html[pos:m.start()])
+        if m.group(1) is not None:
+            slot = (m.group(1), None, m.group(0))
+        elif m.group(2) is not None:
+            slot = (m.group(2), None, m.group(0))
+        else:
+            i = next(i for i in SLOT_NAMES if m.group(i) is not None)
+            slot = (SLOT_NAMES[i], m.group(i), m.group(0))
+        segments.append(slot)
+        pos = m.end()
+    if pos < len(html):
+        segments.append(html[pos:])
+    return segments
+
+def fill_deferred_html(segments, fill):
+    ''' Joins the segments, calling fill(name, argument, original_text) for every slot. fill() should return the original text to leave the slot alone. '''
+    return ''.join([x if isinstance(x, str) else fill(*x) for x in segments])
+
+class DeferredHtml:
+    pages = None            # key of the file object --> segments of the first-pass html
+
+    def __init__(self, pb):
+        self.pb = pb
+        self.pb.deferred_html = self
+        self.pages = {}
+        self._unwritten_by_folder = None
+
+    def add(self, fo, html):
+        self.pages[fo.key] = split_html(html)
+
+    def add_segments(self, fo, segments):
+        ''' Used to take over the pages that were rendered in a worker process '''
+        self.pages[fo.key] = segments
+
+    def has(self, fo):
+        return fo.key in self.pages
+
+    def get_first_pass_html(self, fo):
+        return fill_deferred_html(self.pages[fo.key], lambda name, arg, text: text)
+
+    def remove(self, fo):
+        del self.pages[fo.key]
+
+    def get_unwritten_paths(self, folder_path):
+        ''' Returns the html paths in the given folder of the pages that are not written to disk yet (used when indexing the output folder) '''
+        if self._unwritten_by_folder is None:
+            self._unwritten_by_folder = {}
+            files = self.pb.index.files
+            for key in self.pages.keys():
+                path = files[key].path['html']['file_absolute_path']
+                self._unwritten_by_folder.setdefault(path.parent.as_posix(), []).append(path)
+        return [x for x in self._unwritten_by_folder.get(Path(folder_path).as_posix(), []) if not x.exists()]
+
+    def path_exists(self, path):
+        ''' Same as path.exists(), but also True for pages that are not written to disk yet '''
+        path = Path(path)
+        return path.exists() or (path in self.get_unwritten_paths(path.parent))
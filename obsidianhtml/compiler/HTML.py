@@ -102,7 +102,7 @@ def recurseTagList(tagtree, tagpath, pb, level):
         md += '\n# Notes\n'
         for note_tuple in tagtree['notes']:
             fo, url = note_tuple
-            note_name = fo.md.GetNodeName() #note_url.split('/')[-1].replace(".html", "")
+            note_name = fo.node['name'] #note_url.split('/')[-1].replace(".html", "")
             md += f'- [{note_name}]({html_url_prefix}/{url})\n'
 
     md += f'\n> [View all tags]({html_url_prefix}/obs.html/tags/index.html)'
@@ -149,7 +149,7 @@ def create_foldable_tag_lists(pb):
             tag_tree['notes'] = sorted(tag_tree['notes'], key=lambda x: x[1])  # sort on url #tag_tree['notes'].sort() #
             for note in tag_tree['notes']:
                 fo, url = note
-                note_name = fo.md.GetNodeName() #note.split('/')[-1].replace(".html", "")
+                note_name = fo.node['name'] #note.split('/')[-1].replace(".html", "")
                 ahref = f'<a href="{pb.gc("html_url_prefix")}/{url}">{note_name}</a>'
                 notes += f'<li>{ahref}</li>'
             notes += '</ul></div>'
@@ -6,7 +6,10 @@ import gzip
 import shutil
 import warnings
 import yaml
+import multiprocessing
 from time import sleep
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import regex as re          # regex string finding/replacing
 import urllib.parse         # convert link characters like %
@@ -23,10 +26,12 @@ from ..core.ErrorHandling import extra_info
 from ..core.PicknickBasket import PicknickBasket
 from ..core.FileObject import FileObject
 from ..core.Index import Index
+from ..core.BuildManifest import BuildManifest, hash_text
 from ..core.FileFinder import GetObsidianFilePath, FindFile, GetNodeId
 
-from ..parser.MarkdownPage import MarkdownPage, ConvertMarkdownToHeaderTree
+from ..parser.MarkdownPage import MarkdownPage, SortMetadata, replace_literals, MarkdownLinkRegex, BareUrlRegex
 from ..parser.MarkdownLink import MarkdownLink
+from ..parser.TransclusionCache import TransclusionCache
 
 from ..features.RssFeed import RssFeed
 from ..features.CreateIndexFromTags import CreateIndexFromTags
@@ -35,6 +40,7 @@ from ..features.SidePane import get_side_pane_html, gc_add_toc_when_missing, get
 
 from ..compiler.HTML import compile_navbar_links, create_folder_navigation_view, create_foldable_tag_lists, recurseTagList
 from ..compiler.Templating import ExportStaticFiles
+from ..compiler.DeferredHtml import DeferredHtml, split_html, fill_deferred_html
 
 from ..markdown_extensions.CallOutExtension import CallOutExtension
 from ..markdown_extensions.DataviewExtension import DataviewExtension
@@ -47,7 +53,9 @@ from ..markdown_extensions.EmbeddedSearchExtension import EmbeddedSearchExtensio
 from ..markdown_extensions.CodeWrapperExtension import CodeWrapperExtension
 from ..markdown_extensions.AdmonitionExtension import AdmonitionExtension
 
-def ConvertVault(config_yaml_location=''):
+def ConvertVault(config_yaml_location='', vault_copy=None, force_incremental_build=False):
+    ''' Converts the vault. The watch command passes in the copy of the vault that it keeps up to date (vault_copy), 
+        and forces incremental builds so that only the notes affected by a change are converted again. '''
     # Set config
     # ---------------------------------------------------------
     pb = PicknickBasket()
@@ -58,15 +66,32 @@ def ConvertVault(config_yaml_location=''):
             pb.verbose = True
             break
 
+    # Set number of processes to render html with (overwrite config)
+    for i, v in enumerate(sys.argv):
+        if v in ('-j', '--jobs'):
+            if len(sys.argv) < (i + 2):
+                raise Exception(f'No value given for {v}. Use: {v} <number of processes>')
+            pb.jobs = int(sys.argv[i+1])
+            break
+
     # Load config, paths, etc
     pb.loadConfig(config_yaml_location)
+    if force_incremental_build:
+        pb.sc('toggles/incremental_build', True)
     pb.set_paths()
     pb.compile_dynamic_inclusions()
     pb.config.load_embedded_titles_plugin()
 
+    # Load the manifest of the previous build (when building incrementally)
+    BuildManifest(pb)
+
     # Setup filesystem
     # ---------------------------------------------------------
-    tmpdir = Actor.Optional.copy_vault_to_tempdir(pb)
+    if vault_copy is None:
+        tmpdir = Actor.Optional.copy_vault_to_tempdir(pb)
+    else:
+        tmpdir = vault_copy
+        pb.update_paths(reason='using_tmpdir', tmpdir=tmpdir)
     Actor.Optional.remove_previous_obsidianhtml_output(pb)
     Actor.create_obsidianhtml_output_folders(pb)
 
@@ -80,6 +105,11 @@ def ConvertVault(config_yaml_location=''):
     convert_markdown_to_html(pb)
     compile_rss_feed(pb)
     export_user_files(pb)
+    finish_markdown_writes(pb)
+    pb.manifest.finalize()
+
+    if pb.gc('toggles/verbose_printout', cached=True):
+        print(f'> STAT CACHE: {index.stat_calls_avoided} stat calls avoided')
 
     # Wrap up 
     # ---------------------------------------------------------
@@ -89,6 +119,9 @@ def ConvertVault(config_yaml_location=''):
     if pb.gc('toggles/compile_html'):
         print(f"\thtml: {pb.paths['html_output_folder']}")
 
+    # (used by the watch command)
+    return pb, tmpdir
+
 def convert_obsidian_notes_to_markdown(pb):
     if pb.gc('toggles/compile_md', cached=True):
         # Create index.md based on given tagnames, that will serve as the entrypoint
@@ -110,34 +143,56 @@ def convert_obsidian_notes_to_markdown(pb):
         if pb.gc('toggles/force_filename_to_lowercase', cached=True):
             rel_entry_path_str = rel_entry_path_str.lower()
 
+        # With the fused pipeline, the markdown notes are written in the background
+        init_markdown_writer(pb)
+
+        # Notes that are included in other notes are only converted once per inclusion
+        pb.transclusion_cache = TransclusionCache()
+
+        # When using multiple processes, the notes are converted by worker processes, and this process only keeps track of what to convert next
+        jobs = get_process_count(pb, 'Converting notes')
+
+        # The depth at which a note is reached depends on the order in which the notes are crawled, which is only fixed in a single process
+        if jobs > 1 and pb.gc('max_note_depth') > -1:
+            print(f'\tWARNING: Converting notes with {jobs} processes is not supported in combination with max_note_depth. Converting notes in a single process instead.')
+            jobs = 1
+
         # Start conversion
-        entrypoint_file_object = pb.index.files[rel_entry_path_str]
-        pb.init_state(action='n2m', loop_type='note', current_fo=entrypoint_file_object, subroutine='crawl_obsidian_notes_and_convert_to_markdown')
-        crawl_obsidian_notes_and_convert_to_markdown(entrypoint_file_object, pb)
-        pb.reset_state()
+        entrypoints = [pb.index.files[rel_entry_path_str]]
 
         # also do the tags page if it is not the index, otherwise this page will never be hit
         if pb.gc('toggles/features/create_index_from_tags/enabled') and not pb.gc('toggles/features/create_index_from_tags/use_as_homepage'):
-            entrypoint_file_object = pb.index.files[pb.gc('toggles/features/create_index_from_tags/rel_output_path')]
-            pb.init_state(action='n2m', loop_type='note', current_fo=entrypoint_file_object, subroutine='crawl_obsidian_notes_and_convert_to_markdown')
-            crawl_obsidian_notes_and_convert_to_markdown(entrypoint_file_object, pb)
-            pb.reset_state()
+            entrypoints.append(pb.index.files[pb.gc('toggles/features/create_index_from_tags/rel_output_path')])
+
+        if jobs > 1:
+            crawl_obsidian_notes_in_process_pool(entrypoints, pb, jobs)
+        else:
+            for entrypoint_file_object in entrypoints:
+                crawl_notes(entrypoint_file_object, pb, crawl_obsidian_notes_and_convert_to_markdown, action='n2m', loop_type='note')
 
         # Keep going until all other files are processed
         if pb.gc('toggles/process_all', cached=True):
             print('\t> FEATURE: PROCESS ALL')
             unparsed = [x for x in pb.index.files.values() if x.processed_ntm == False]
-            i = 0
-            l = len(unparsed)
-            for fo in unparsed:
-                i += 1
-                if pb.gc('toggles/verbose_printout', cached=True) == True:
-                    print(f'\t\t{i}/{l} - ' + str(fo.path['note']['file_absolute_path']))
-                pb.init_state(action='n2m_process_all', loop_type='note', current_fo=fo, subroutine='crawl_obsidian_notes_and_convert_to_markdown')
-                crawl_obsidian_notes_and_convert_to_markdown(fo, pb, log_level=2)
-                pb.reset_state()
+            if jobs > 1:
+                crawl_obsidian_notes_in_process_pool(unparsed, pb, jobs, log_level=2, action='n2m_process_all')
+            else:
+                i = 0
+                l = len(unparsed)
+                for fo in unparsed:
+                    i += 1
+                    if pb.gc('toggles/verbose_printout', cached=True) == True:
+                        print(f'\t\t{i}/{l} - ' + str(fo.path['note']['file_absolute_path']))
+                    crawl_notes(fo, pb, crawl_obsidian_notes_and_convert_to_markdown, action='n2m', loop_type='note', process_all=True, log_level=2)
             print('\t< FEATURE: PROCESS ALL: Done')
 
+        # Remove markdown output of notes that are no longer converted
+        pb.manifest.remove_stale_output('ntm')
+
+        if pb.gc('toggles/verbose_printout', cached=True):
+            cache = pb.transclusion_cache
+            print(f'\t> TRANSCLUSION CACHE: {cache.hits} hits, {cache.misses} misses')
+
     if pb.gc('toggles/extended_logging', cached=True):
         WriteFileLog(pb.index.files, pb.paths['log_output_folder'].joinpath('files_ntm.md'), include_processed=True)
 
@@ -150,6 +205,9 @@ def convert_markdown_to_html(pb):
     # Prepare reusable blocks
     compile_navbar_links(pb)
 
+    # Keeps the html of the first pass until the second pass
+    DeferredHtml(pb)
+
     # Force search to lowercase
     rel_entry_path_str = pb.paths['rel_md_entrypoint_path'].as_posix()
     if pb.gc('toggles/force_filename_to_lowercase', cached=True):
@@ -157,18 +215,17 @@ def convert_markdown_to_html(pb):
 
     # Conversion: md -> html
     # -----------------------------------------------------------
+    # When using multiple processes, the crawl below only queues the pages, which are rendered afterwards
+    init_render_queue(pb)
+
     # Start conversion from the entrypoint
     entrypoint_file_object = pb.index.files[rel_entry_path_str]
-    pb.init_state(action='m2h', loop_type='md_note', current_fo=entrypoint_file_object, subroutine='crawl_markdown_notes_and_convert_to_html')
-    crawl_markdown_notes_and_convert_to_html(entrypoint_file_object, pb)
-    pb.reset_state()
+    crawl_notes(entrypoint_file_object, pb, crawl_markdown_notes_and_convert_to_html, action='m2h', loop_type='md_note')
 
     # also do the tags page if it is not the index, otherwise this page will never be hit
     if pb.gc('toggles/features/create_index_from_tags/enabled') and not pb.gc('toggles/features/create_index_from_tags/use_as_homepage'):
         entrypoint_file_object = pb.index.files[pb.gc('toggles/features/create_index_from_tags/rel_output_path')]
-        pb.init_state(action='m2h', loop_type='md_note', current_fo=entrypoint_file_object, subroutine='crawl_markdown_notes_and_convert_to_html')
-        crawl_markdown_notes_and_convert_to_html(entrypoint_file_object, pb, capture_in_jar='tags_page_html')
-        pb.reset_state()
+        crawl_notes(entrypoint_file_object, pb, crawl_markdown_notes_and_convert_to_html, action='m2h', loop_type='md_note', capture_in_jar='tags_page_html')
 
     # Keep going until all other files are processed
     if pb.gc('toggles/process_all') == True:
@@ -180,16 +237,24 @@ def convert_markdown_to_html(pb):
             if pb.gc('toggles/verbose_printout', cached=True) == True:
                 print(f'\t\t{i}/{l} - ' + str(fo.path['markdown']['file_absolute_path']))
 
-            pb.init_state(action='m2h_process_all', loop_type='md_note', current_fo=fo, subroutine='crawl_markdown_notes_and_convert_to_html')
-            crawl_markdown_notes_and_convert_to_html(fo, pb, log_level=2)
-            pb.reset_state()
+            crawl_notes(fo, pb, crawl_markdown_notes_and_convert_to_html, action='m2h', loop_type='md_note', process_all=True, log_level=2)
 
         print('\t< FEATURE: PROCESS ALL: Done')
 
+    render_queued_pages(pb)
+
+    # The converted notes that were handed over in memory (fused pipeline) are not needed anymore, and neither are the parsed notes
+    for fo in pb.index.files.values():
+        fo.converted_md = None
+    pb.index.parsed_notes.clear()
+
     if pb.gc('toggles/extended_logging', cached=True):
         WriteFileLog(pb.index.files, pb.paths['log_output_folder'].joinpath('files_mth.md'), include_processed=True)
 
 
+    # Remove html output of notes that are no longer converted
+    pb.manifest.remove_stale_output('mth')
+
     # [??] Second pass
     # ------------------------------------------
     # Some code can only be generated when all the notes have already been created.
@@ -211,7 +276,7 @@ def convert_markdown_to_html(pb):
     print('\t> SECOND PASS HTML')
 
     for fo in pb.index.files.values():
-        if not fo.metadata['is_note']:
+        if not fo.metadata['is_note'] or not pb.deferred_html.has(fo):
             continue
 
         # get paths / html prefix
@@ -221,21 +286,19 @@ def convert_markdown_to_html(pb):
         page_depth = len(dst_rel_path_str.split('/')) - 1
 
         # get html content
-        try:
-            with open(dst_abs_path, 'r', encoding="utf-8") as f:
-                html = f.read()
-        except:
-            continue
+        # The first-pass html is kept in memory, split up into static segments and the slots that are filled in below
+        segments = pb.deferred_html.pages[fo.key]
+        fills = {}
 
         # Get node_id
-        m = re.search(r'(?<=\{_obsidian_html_node_id_pattern_:)(.*?)(?=\})', html)
-        if m is None:
+        node_ids = [x[1] for x in segments if not isinstance(x, str) and x[0] == 'node_id']
+        if len(node_ids) == 0:
+            pb.manifest.write_html(dst_abs_path, pb.deferred_html.get_first_pass_html(fo))
+            pb.deferred_html.remove(fo)
             continue
-        node_id = m.group(0)
+        node_id = node_ids[0]
         node = pb.index.network_tree.node_lookup[node_id]
 
-        html = re.sub('\{_obsidian_html_node_id_pattern_:'+node_id+'}', '', html)
-
         # Create Directory contents
         # if pb.gc('toggles/features/styling/add_dir_list', cached=True):
         #     if dir_repstring in html:
@@ -243,15 +306,12 @@ def convert_markdown_to_html(pb):
         #         dir_list = pb.treeobj.BuildIndex(current_page=node['url'])
         #         html = re.sub(dir_repstring, dir_list, html)
         #         html = re.sub(dir_repstring2, '', html)
-        left_pane = get_side_pane_html(pb, 'left_pane', node)
-        html = html.replace('{left_pane}', left_pane)
-
-        right_pane = get_side_pane_html(pb, 'right_pane', node)
-        html = html.replace('{right_pane}', right_pane)
+        fills['left_pane'] = get_side_pane_html(pb, 'left_pane', node)
+        fills['right_pane'] = get_side_pane_html(pb, 'right_pane', node)
 
         # Compile backlinks list
         if pb.gc('toggles/features/backlinks/enabled', cached=True):
-            backlinks = [x for x in pb.index.network_tree.tree['links'] if x['target'] == node_id]
+            backlinks = pb.index.network_tree.get_backlinks(node_id)
             snippet = ''
             if len(backlinks) > 0:
                 snippet = "<h2>Backlinks</h2>\n<ul>\n"
@@ -268,8 +328,8 @@ def convert_markdown_to_html(pb):
             else:
                 snippet = f'<div class="backlinks" style="display:none"></div>\n'
 
-            # replace placeholder with list & write output
-            html = re.sub('\{_obsidian_html_backlinks_pattern_\}', snippet, html)
+            # fill in placeholder with list
+            fills['backlinks'] = snippet
 
         # Compile tags list
         def get_tags(node):
@@ -277,12 +337,13 @@ def convert_markdown_to_html(pb):
                 return node['metadata']['tags']
             return []
         tags = get_tags(node)
+        inline_tags = {}
 
         if pb.gc('toggles/features/tags_page/styling/show_in_note_footer', cached=True):
             # Replace placeholder
             snippet = ''
 
-            if 'obs.html.tags' in fo.md.metadata.keys() and 'no_tag_footer' in fo.md.metadata['obs.html.tags']:
+            if 'obs.html.tags' in node['metadata'].keys() and 'no_tag_footer' in node['metadata']['obs.html.tags']:
                 pass
             else:
                 if tags:
@@ -292,13 +353,11 @@ def convert_markdown_to_html(pb):
                         snippet += f'\t<li><a class="backlink" href="{url}">{tag}</a></li>\n'
 
                         if pb.gc('toggles/preserve_inline_tags', cached=True):
-                            placeholder = re.escape("<code>{_obsidian_pattern_tag_" + tag + "}</code>")
-                            inline_tag = f'<a class="inline-tag" href="{url}">{tag}</a>'
-                            html = re.sub(placeholder, inline_tag, html)
+                            inline_tags[tag] = f'<a class="inline-tag" href="{url}">{tag}</a>'
                     snippet += '</ul>'
 
-            # replace placeholder with list & write output
-            html = re.sub('\{_obsidian_html_tags_footer_pattern_\}', snippet, html)
+            # fill in placeholder with list
+            fills['tags_footer'] = snippet
 
 
         # add breadcrumbs
@@ -352,75 +411,40 @@ def convert_markdown_to_html(pb):
                     </div>
                 </div>'''
 
-            html = re.sub('\{_obsidian_html_breadcrumbs_pattern_\}', snippet, html)
-
-        # add embedded search results
-        if pb.gc('toggles/features/embedded_search/enabled', cached=True):
-            query_blocks = re.findall(r'(?<=<p>{_obsidian_html_query:)(.*?)(?=\ }</p>)', html)
-            for listing in query_blocks:
-                # split listing into qualifier and user_query
-                qual, user_query = listing.split('|-|')
-
-                # found query
-                print(qual, user_query)
-
-                # search
-                res = esearch.search(user_query)
-
-                # compile html output
-                output = ''
-                if qual == 'list':
-                    output = '<div class="query"><ul>\n\t' + '\n\t'.join([f'<li><a href="/{x["path"]}">{x["title"]}</a></li>' for x in res]) + '\n</ul></div>'
-                
-                else:
-                    output = '<div class="query">'
-                    for doc in res:
-                        # setup doc
-                        output += f'\n\t<div class="match-document">\n\t\t<div class="match-document-title">\n\t\t\t<a href="/{doc["path"]}">{doc["title"]}</a>\n\t\t</div>\n\t\t<div class="matches">'
-                        
-                        # Add path matches
-                        if doc['matches']['path']:
-                            output += f'\n\t\t\t<div class="match-row">\n\t\t\t\t' + doc['matches']['path'] + '\n\t\t\t</div>'
-
-                        # Add content mathes
-                        for match in doc['matches']['content']:
-                            output += f'\n\t\t\t<div class="match-row">\n\t\t\t\t{match}\n\t\t\t</div>'
-
-                        # Add tags
-                        if len(doc['matches']['tags']) > 0:
-                            output += '\n\t\t\t<div class="tag-box">'
-                            for match, tag in doc['matches']['tags']:
-                                output += f'\n\t\t\t\t<div class="match-row tag">\n\t\t\t\t\t<a href="/obs.html/tags/{tag}/index.html">{match}</a>\n\t\t\t\t</div>'
-                            output += '\n\t\t\t</div>'
-
-                        if len(doc['matches']['tags_keyword']) > 0:
-                            output += '\n\t\t\t<div class="tag-box">'
-                            for match, tag in doc['matches']['tags_keyword']:
-                                output += f'\n\t\t\t\t<div class="match-row tag keyword">\n\t\t\t\t\t<a href="/obs.html/tags/{tag}/index.html">{match}</a>\n\t\t\t\t</div>'
-                            output += '\n\t\t\t</div>'
-
-                        # close doc divs
-                        output += '\n\t\t</div>\n\t</div>'
-                    # close query div
-                    output += '\n</div>'
-
-                # replace query block with html
-                try:
-                    safe_str = re.escape('<p>{_obsidian_html_query:' + listing + ' }</p>')
-                    html = re.sub(safe_str, output, html)
-                except:
-                    print(listing)
-                    raise
-
-        # write result
-        with open(dst_abs_path, 'w', encoding="utf-8") as f:
-            f.write(html)
+            fills['breadcrumbs'] = snippet
+
+        # fill in the slots & write result
+        def fill(name, arg, text, in_pane=False):
+            if name == 'node_id':
+                return '' if (arg == node_id and not in_pane) else text
+            if name in ('left_pane', 'right_pane'):
+                # the side pane can contain (the first-pass html of) another page, fill in its slots for this page as well
+                if in_pane:
+                    return text
+                return fill_deferred_html(split_html(fills[name]), lambda *slot: fill(*slot, in_pane=True))
+            if name == 'tag':
+                return inline_tags.get(arg, text)
+            if name == 'query':
+                # add embedded search results
+                if esearch is None:
+                    return text
+                return compile_embedded_search_html(esearch, arg)
+            return fills.get(name, text)
+
+        html = fill_deferred_html(segments, fill)
+        pb.manifest.write_html(dst_abs_path, html)
+        pb.deferred_html.remove(fo)
         
     print('\t< SECOND PASS HTML: Done')
 
     # Create system pages
     # -----------------------------------------------------------
     # Create tag pages
+    if pb.manifest.usable:
+        # remove tag pages of the previous build, as tags might have been removed
+        tags_folder = pb.paths['html_output_folder'].joinpath('obs.html/tags')
+        if tags_folder.exists():
+            shutil.rmtree(tags_folder)
     recurseTagList(pb.tagtree, '', pb, level=0)
     create_foldable_tag_lists(pb)
 
@@ -462,6 +486,115 @@ def convert_markdown_to_html(pb):
 
     print('< COMPILING HTML FROM MARKDOWN CODE: Done')
 
+def compile_embedded_search_html(esearch, listing):
+    ''' Returns the html of an embedded search query in a note, e.g. {_obsidian_html_query:list|-|tags:type/index} '''
+    # split listing into qualifier and user_query
+    qual, user_query = listing.split('|-|')
+
+    # found query
+    print(qual, user_query)
+
+    # search
+    res = esearch.search(user_query)
+
+    # compile html output
+    output = ''
+    if qual == 'list':
+        output = '<div class="query"><ul>\n\t' + '\n\t'.join([f'<li><a href="/{x["path"]}">{x["title"]}</a></li>' for x in res]) + '\n</ul></div>'
+
+    else:
+        output = '<div class="query">'
+        for doc in res:
+            # setup doc
+            output += f'\n\t<div class="match-document">\n\t\t<div class="match-document-title">\n\t\t\t<a href="/{doc["path"]}">{doc["title"]}</a>\n\t\t</div>\n\t\t<div class="matches">'
+
+            # Add path matches
+            if doc['matches']['path']:
+                output += f'\n\t\t\t<div class="match-row">\n\t\t\t\t' + doc['matches']['path'] + '\n\t\t\t</div>'
+
+            # Add content mathes
+            for match in doc['matches']['content']:
+                output += f'\n\t\t\t<div class="match-row">\n\t\t\t\t{match}\n\t\t\t</div>'
+
+            # Add tags
+            if len(doc['matches']['tags']) > 0:
+                output += '\n\t\t\t<div class="tag-box">'
+                for match, tag in doc['matches']['tags']:
+                    output += f'\n\t\t\t\t<div class="match-row tag">\n\t\t\t\t\t<a href="/obs.html/tags/{tag}/index.html">{match}</a>\n\t\t\t\t</div>'
+                output += '\n\t\t\t</div>'
+
+            if len(doc['matches']['tags_keyword']) > 0:
+                output += '\n\t\t\t<div class="tag-box">'
+                for match, tag in doc['matches']['tags_keyword']:
+                    output += f'\n\t\t\t\t<div class="match-row tag keyword">\n\t\t\t\t\t<a href="/obs.html/tags/{tag}/index.html">{match}</a>\n\t\t\t\t</div>'
+                output += '\n\t\t\t</div>'
+
+            # close doc divs
+            output += '\n\t\t</div>\n\t</div>'
+        # close query div
+        output += '\n</div>'
+
+    return output
+
+def get_process_count(pb, task):
+    ''' Returns the number of processes to use for the given task (see --jobs) '''
+    jobs = pb.gc('jobs', cached=True)
+    if jobs < 2:
+        return 1
+
+    # The worker processes get their input (and everything else) by being forked from this process
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        print(f'\tWARNING: {task} with {jobs} processes is not supported on this platform. {task} in a single process instead.')
+        return 1
+
+    return jobs
+
+def init_render_queue(pb):
+    if get_process_count(pb, 'Rendering') > 1:
+        pb.render_queue = []
+
+# Worker processes read their input from here, rather than getting it pickled and sent over
+_render_queue = None
+
+def render_queued_page(i):
+    fo, md, node, html_url_prefix, capture_in_jar = _render_queue[i]
+    pb = fo.pb
+
+    if pb.gc('toggles/relative_path_html', cached=True):
+        pb.sc(path='html_url_prefix', value=html_url_prefix)
+
+    pb.init_state(action='m2h', loop_type='md_note', current_fo=fo, subroutine='convert_markdown_page_to_html')
+    convert_markdown_page_to_html(fo, md, node, pb, capture_in_jar=capture_in_jar)
+
+    jar = pb.jars[capture_in_jar] if capture_in_jar else None
+    return jar, pb.deferred_html.pages[fo.key]
+
+def render_queued_pages(pb):
+    ''' Renders the pages that were queued during the crawl in a pool of worker processes (see --jobs) '''
+    global _render_queue
+    if pb.render_queue is None:
+        return
+
+    jobs = pb.gc('jobs', cached=True)
+    queue = pb.render_queue
+    pb.render_queue = None
+
+    print(f'\t> RENDERING {len(queue)} PAGES WITH {jobs} PROCESSES')
+
+    _render_queue = queue
+    try:
+        chunksize = max(1, len(queue) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork')) as executor:
+            for (fo, md, node, html_url_prefix, capture_in_jar), (jar, segments) in zip(queue, executor.map(render_queued_page, range(len(queue)), chunksize=chunksize)):
+                if capture_in_jar:
+                    pb.jars[capture_in_jar] = jar
+                pb.deferred_html.add_segments(fo, segments)
+                fo.release_markdown_page()
+    finally:
+        _render_queue = None
+
+    print('\t< RENDERING PAGES: Done')
+
 def compile_rss_feed(pb):
     if not pb.gc('toggles/features/rss/enabled'):
         return
@@ -505,29 +638,102 @@ def export_user_files(pb):
 
     print('< EXPORTING USER FILES: Done')
 
+def crawl_notes(fo:'FileObject', pb, visit, action, loop_type, process_all=False, **kwargs):
+    '''Calls visit() on the given note, and then on every note that it (indirectly) links to, depth-first.
+
+    visit(fo, pb, **kwargs) converts a single note, and returns the notes to visit next as a list of (fo, kwargs) tuples.
+    The notes are visited in the same order as when visit() would call itself for every link, but an explicit stack is used
+    instead, so that long chains of linked notes don't run into the recursion limit.
+    '''
+    entry_action = f'{action}_process_all' if process_all else action
+
+    stack = [iter([(fo, kwargs)])]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+            continue
+        fo, kwargs = item
+
+        pb.init_state(action=(entry_action if len(stack) == 1 else action), loop_type=loop_type, current_fo=fo, subroutine=visit.__name__)
+        links = visit(fo, pb, **kwargs)
+        pb.reset_state()
+
+        if links:
+            stack.append(iter(links))
+
 @extra_info()
-def crawl_obsidian_notes_and_convert_to_markdown(fo:'FileObject', pb, log_level=1, iteration=0):
-    '''This functions converts an obsidian note to a markdown file and calls itself on any local note links it finds in the page.'''
+def crawl_obsidian_notes_and_convert_to_markdown(fo:'FileObject', pb, log_level=1, iteration=0, parent_fo=None):
+    '''This functions converts an obsidian note to a markdown file and returns any local note links it finds in the page (see crawl_notes()).'''
+
+    # Notes that are linked to are only converted once
+    if parent_fo is not None:
+        if fo.processed_ntm == True:
+            if pb.gc('toggles/verbose_printout', cached=True):
+                print('\t'*log_level, f"(ntm) Skipping converting {fo.link}, already processed.")
+            return
+
+        # Mark the file as processed so that it will not be processed again at a later stage
+        fo.processed_ntm = True
 
-    # Unpack so we don't have to type too much.
-    paths = pb.paths        # Paths of interest, such as the output and input folders
-    files = pb.index.files        # Hashtable of all files found in the obsidian vault
+        if pb.gc('toggles/verbose_printout', cached=True):
+            print('\t'*log_level, f"found link {fo.path['note']['file_absolute_path']} (through parent {parent_fo.path['note']['file_absolute_path']})")
 
     # Don't parse if not parsable
     if not fo.metadata['is_parsable_note']:
         return
 
+    # Reuse the output of the previous build if nothing changed (incremental build)
+    # ------------------------------------------------------------------
+    if pb.manifest.is_clean(fo, 'ntm'):
+        record = pb.manifest.reuse(fo, 'ntm')
+        links = pb.manifest.get_links(record)
+        leaf_note = record['leaf_note']
+    else:
+        md = convert_obsidian_note_to_markdown(fo, pb)
+        links = md.links
+        leaf_note = is_leaf_note(md)
+        pb.manifest.record(fo, 'ntm', links=links, leaf_note=leaf_note, inclusions=md.included_files)
+
+    # Return every link in the current page to be converted next
+    # ------------------------------------------------------------------
+    # Don't follow links if this would exceed max note depth
+    iteration += 1
+    if pb.gc('max_note_depth') > -1 and iteration > pb.gc('max_note_depth'):
+        return
+
+    # Don't follow links when the user tells us not to
+    if leaf_note:
+        return
+
+    return [(link_fo, dict(log_level=log_level, iteration=iteration, parent_fo=fo)) for link_fo in links]
+
+def convert_obsidian_note_to_markdown(fo:'FileObject', pb):
+    '''Converts the obsidian note to markdown and writes it to the markdown folder. Returns the MarkdownPage.'''
+
     # Convert note to markdown
     # ------------------------------------------------------------------
     # Create an object that handles a lot of the logic of parsing the page paths, content, etc
-    md = fo.load_markdown_page('note')
+    # (not kept on the file object, the markdown page is loaded again when converting it to html)
+    md = MarkdownPage(fo, 'note')
     
     # The bulk of the conversion process happens here
     md.ConvertObsidianPageToMarkdownPage()
 
     # The frontmatter was stripped from the obsidian note prior to conversion
     # Add yaml frontmatter back in
-    md.page = (frontmatter.dumps(frontmatter.Post("", **md.metadata))) + '\n' + md.page
+    text = (frontmatter.dumps(frontmatter.Post("", **md.metadata))) + '\n' + md.page
+
+    # Hand the note over to the html conversion (fused pipeline)
+    # ------------------------------------------------------------------
+    # This is what MarkdownPage would read back in from the markdown file: the frontmatter yaml 
+    # is written with sorted keys, and the content is stripped when it is parsed again.
+    if use_fused_pipeline(pb):
+        fo.converted_md = {
+            'metadata': SortMetadata(md.metadata),
+            'page': md.page.strip(),
+            'hash': hash_text(text) if pb.manifest.enabled else None,
+        }
 
     # Save file
     # ------------------------------------------------------------------
@@ -536,48 +742,154 @@ def crawl_obsidian_notes_and_convert_to_markdown(fo:'FileObject', pb, log_level=
     dst_path.parent.mkdir(parents=True, exist_ok=True)
 
     # Write markdown to file
+    if pb.markdown_writer is not None:
+        pb.markdown_writes.append(pb.markdown_writer.submit(write_markdown_file, dst_path, text))
+    else:
+        write_markdown_file(dst_path, text)
+    pb.index.register_written_file(dst_path)
+
+    return md
+
+def write_markdown_file(dst_path, text):
     with open(dst_path, 'w', encoding="utf-8") as f:
-        f.write(md.page)
+        f.write(text)
 
-    # Recurse for every link in the current page
-    # ------------------------------------------------------------------
-    # Don't follow links if this would exceed max note depth
-    iteration += 1
-    if pb.gc('max_note_depth') > -1 and iteration > pb.gc('max_note_depth'):
-        return
+def use_fused_pipeline(pb):
+    return pb.gc('toggles/fused_pipeline', cached=True) and pb.gc('toggles/compile_html', cached=True)
 
-    # Don't follow links when the user tells us not to
-    if 'obs.html.tags' in md.metadata.keys() and 'leaf_note' in md.metadata['obs.html.tags']:
+def init_markdown_writer(pb):
+    if use_fused_pipeline(pb):
+        pb.markdown_writer = ThreadPoolExecutor(max_workers=1)
+        pb.markdown_writes = []
+
+def finish_markdown_writes(pb):
+    ''' Waits for the markdown files that are written in the background (fused pipeline), and raises any errors that occurred while writing them '''
+    if pb.markdown_writer is None:
         return
+    pb.markdown_writer.shutdown(wait=True)
+    for future in pb.markdown_writes:
+        future.result()
+    pb.markdown_writer = None
+    pb.markdown_writes = None
 
-    for link_fo in md.links:
-        if link_fo == False or link_fo.processed_ntm == True:
-            if pb.gc('toggles/verbose_printout', cached=True):
-                if link_fo == False:
-                    print('\t'*log_level, f"(ntm) Skipping converting {link_fo.link}, link not internal or not valid.")
-                else:
+def is_leaf_note(md):
+    return ('obs.html.tags' in md.metadata.keys() and 'leaf_note' in md.metadata['obs.html.tags'])
+
+# Worker processes get the picknick basket by being forked from this process, rather than getting it pickled and sent over
+_worker_pb = None
+
+@extra_info()
+def convert_obsidian_note_in_worker(key, action):
+    '''Runs in a worker process. Converts the note and returns what the coordinating process needs to know about it.'''
+    pb = _worker_pb
+    fo = pb.index.files[key]
+
+    # The background writer of the coordinating process does not exist in the worker, just write the markdown files directly
+    pb.markdown_writer = None
+
+    pb.init_state(action=action, loop_type='note', current_fo=fo, subroutine='convert_obsidian_note_to_markdown')
+    hits, misses = pb.transclusion_cache.hits, pb.transclusion_cache.misses
+    md = convert_obsidian_note_to_markdown(fo, pb)
+    cache_stats = (pb.transclusion_cache.hits - hits, pb.transclusion_cache.misses - misses)
+
+    # Attachments are copied by the worker, but should be attributed to the note in the coordinating process
+    copies, pb.manifest.pending_copies = pb.manifest.pending_copies, set()
+
+    return [x.key for x in md.links], is_leaf_note(md), md.included_files, sorted(copies), fo.converted_md, cache_stats
+
+def crawl_obsidian_notes_in_process_pool(entrypoints, pb, jobs, log_level=1, action='n2m'):
+    '''Multiprocess counterpart of crawl_obsidian_notes_and_convert_to_markdown (see --jobs).
+
+    The notes are converted by a pool of worker processes, which return the links that they found.
+    This process keeps the queue of notes to convert, and only adds notes to it that were not seen before.
+    The notes are not converted depth-first, so this can't be used in combination with max_note_depth.
+    '''
+    global _worker_pb
+    files = pb.index.files
+
+    queue = deque()         # file objects of notes that still need to be converted
+    running = {}            # future --> file object
+
+    def follow_links(fo, links, leaf_note):
+        # Don't follow links when the user tells us not to
+        if leaf_note:
+            return
+
+        for link_fo in links:
+            if link_fo.processed_ntm == True:
+                if pb.gc('toggles/verbose_printout', cached=True):
                     print('\t'*log_level, f"(ntm) Skipping converting {link_fo.link}, already processed.")
-            continue
+                continue
 
-        # Mark the file as processed so that it will not be processed again at a later stage
-        link_fo.processed_ntm = True
+            # Mark the file as processed so that it will not be queued again
+            link_fo.processed_ntm = True
 
-        # Convert the note that is linked to
-        if pb.gc('toggles/verbose_printout', cached=True):
-            print('\t'*log_level, f"found link {link_fo.path['note']['file_absolute_path']} (through parent {fo.path['note']['file_absolute_path']})")
+            if pb.gc('toggles/verbose_printout', cached=True):
+                print('\t'*log_level, f"found link {link_fo.path['note']['file_absolute_path']} (through parent {fo.path['note']['file_absolute_path']})")
 
-        pb.init_state(action='n2m', loop_type='note', current_fo=link_fo, subroutine='crawl_obsidian_notes_and_convert_to_markdown')
-        crawl_obsidian_notes_and_convert_to_markdown(link_fo, pb, log_level=log_level, iteration=iteration)
-        pb.reset_state()
+            queue.append(link_fo)
+
+    for fo in entrypoints:
+        if fo.processed_ntm == False:
+            fo.processed_ntm = True
+            queue.append(fo)
+
+    _worker_pb = pb
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork')) as executor:
+            while queue or running:
+                while queue:
+                    fo = queue.popleft()
+
+                    # Don't parse if not parsable
+                    if not fo.metadata['is_parsable_note']:
+                        continue
+
+                    # Reuse the output of the previous build if nothing changed (incremental build)
+                    if pb.manifest.is_clean(fo, 'ntm'):
+                        record = pb.manifest.reuse(fo, 'ntm')
+                        follow_links(fo, pb.manifest.get_links(record), record['leaf_note'])
+                        continue
+
+                    running[executor.submit(convert_obsidian_note_in_worker, fo.key, action)] = fo
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    fo = running.pop(future)
+                    link_keys, leaf_note, inclusions, copies, fo.converted_md, (hits, misses) = future.result()
+                    pb.transclusion_cache.hits += hits
+                    pb.transclusion_cache.misses += misses
+
+                    # the files that the worker wrote
+                    pb.index.register_written_file(fo.path['markdown']['file_absolute_path'])
+                    for key in copies:
+                        pb.index.register_written_file(files[key].path['markdown']['file_absolute_path'])
+                        pb.manifest.add_copy(files[key], 'ntm')
+                    links = [files[key] for key in link_keys]
+                    pb.manifest.record(fo, 'ntm', links=links, leaf_note=leaf_note, inclusions=inclusions)
+
+                    follow_links(fo, links, leaf_note)
+    finally:
+        _worker_pb = None
 
 @extra_info()
-def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=None, log_level=1, capture_in_jar=False):
-    '''This functions converts a markdown page to an html file and calls itself on any local markdown links it finds in the page.'''
+def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=None, log_level=1, capture_in_jar=False, parent_fo=None):
+    '''This functions converts a markdown page to an html file and returns any local markdown links it finds in the page (see crawl_notes()).'''
     
     # Unpack picknick basket so we don't have to type too much.
     paths = pb.paths                    # Paths of interest, such as the output and input folders
     files = pb.index.files                    # Hashtable of all files found in the obsidian vault
 
+    if parent_fo is not None:
+        if not fo.is_valid_note('markdown'):
+            return
+
+        if pb.gc('toggles/verbose_printout', cached=True):
+            print('\t'*(log_level+1), f"html: initiating conversion for {fo.fullpath('markdown')} (parent {parent_fo.fullpath('markdown')})")
+
     # Don't parse if not parsable
     if not fo.metadata['is_parsable_note']:
         return
@@ -586,11 +898,7 @@ def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=
     rel_dst_path = fo.path['html']['file_relative_path']
 
     if pb.gc('toggles/relative_path_html', cached=True):
-        html_url_prefix = pb.sc(path='html_url_prefix', value=get_rel_html_url_prefix(rel_dst_path.as_posix()))
-    else:
-        html_url_prefix = pb.gc('html_url_prefix')
-
-    page_depth = len(rel_dst_path.as_posix().split('/')) - 1
+        pb.sc(path='html_url_prefix', value=get_rel_html_url_prefix(rel_dst_path.as_posix()))
 
     # Load contents
     # ------------------------------------------------------------------
@@ -612,11 +920,13 @@ def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=
                 inc_md = files[incl].load_markdown_page('markdown')
                 pb.index.network_tree.add_file_object_to_node_list(files[incl], backlink_node, link_type="inclusion")
                 inc_md.fo.processed_mth = False
+                inc_md.fo.release_markdown_page()
                 md.links.append(inc_md.fo)
 
     # Skip further processing if processing has happened already for this file
     # ------------------------------------------------------------------
     if fo.processed_mth == True:
+        fo.release_markdown_page()
         return
 
     if pb.gc('toggles/verbose_printout', cached=True):
@@ -631,6 +941,49 @@ def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=
             filename=page_path.stem, content=md.page, metadata=md.metadata, \
             url=node['url'], rtr_url=node['rtr_url'], title=node['name'] )
 
+    # Reuse the first-pass html of the previous build if nothing changed (incremental build)
+    # ------------------------------------------------------------------
+    if capture_in_jar == False and pb.manifest.is_clean(fo, 'mth', node=node):
+        record = pb.manifest.reuse(fo, 'mth')
+        md.links = pb.manifest.get_links(record)
+        fo.release_markdown_page()
+        pb.deferred_html.add(fo, pb.manifest.load_first_pass_html(fo))
+    else:
+        prepare_markdown_page_for_html(fo, md, pb, log_level=log_level)
+
+        if pb.render_queue is not None:
+            # render later on, in parallel
+            pb.render_queue.append((fo, md, dict(node), pb.gc('html_url_prefix'), capture_in_jar))
+        else:
+            convert_markdown_page_to_html(fo, md, node, pb, capture_in_jar=capture_in_jar)
+            fo.release_markdown_page()
+
+        pb.manifest.record(fo, 'mth', nid=node['nid'], links=md.links, tags=md.metadata['tags'])
+
+    md.AddToTagtree(pb.tagtree, fo.path['html']['file_relative_path'].as_posix())
+
+    # Set file to processed
+    fo.processed_mth = True
+
+    # > Done with this markdown page!
+
+    # Return every link in the current page to be converted next
+    # ------------------------------------------------------------------
+    return [(link_fo, dict(backlink_node=backlink_node, log_level=log_level, parent_fo=fo)) for link_fo in md.links]
+
+# Patterns used by prepare_markdown_page_for_html(). Each step rewrites the page in one pass, resolving every match in a callback.
+HtmlImageLinkRegex = re.compile(r'\!\[.*?\]\((.*?)\)')
+HtmlSourceTagRegex = re.compile(r'(?P<start><(?P<tag>source) src=")(?P<link>[^"]*)(?P<end>")')
+HtmlImgTagRegex = re.compile(r'(?P<start><(?P<tag>img) src=")(?P<link>[^"\n]*)(?P<end>".*?>)')
+HtmlEmbedTagRegex = re.compile(r'(?P<start><(?P<tag>embed) src=")(?P<link>[^"]*)(?P<end>")')
+
+def prepare_markdown_page_for_html(fo:'FileObject', md, pb, log_level=1):
+    '''This function rewrites the links in a loaded markdown page to html links, copies over linked files, and adds the linked notes to md.links.'''
+
+    paths = pb.paths
+    page_path = fo.path['markdown']['file_absolute_path']
+    html_url_prefix = pb.gc('html_url_prefix')
+
     # [1] Replace code blocks with placeholders so they aren't altered
     # They will be restored at the end
     # ------------------------------------------------------------------
@@ -639,10 +992,9 @@ def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=
     # Get all local markdown links. 
     # ------------------------------------------------------------------
     # This is any string in between '](' and  ')' with no spaces in between the ( and )
-    proper_links = re.findall(r'(?<=\]\()[^\s\]]+(?=\))', md.page)
-    for l in proper_links:
-        ol = l
-        l = urllib.parse.unquote(l)
+    def convert_markdown_link(m):
+        ol = m.group(1)
+        l = urllib.parse.unquote(ol)
 
         # There is currently no way to match links containing parentheses, AND not matching the last ) in a link like ([test](link))
         if l.endswith(')'):
@@ -653,7 +1005,7 @@ def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=
 
         # Don't process in the following cases (link empty or // in the link)
         if link.isValid == False or link.isExternal == True: 
-            continue
+            return m.group(0)
 
         # [12] Copy non md files over wholesale, then we're done for that kind of file
         if link.fo is None:
@@ -667,27 +1019,25 @@ def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=
             
         # [13] Link to a custom 404 page when linked to a not-created note
         if link.name == 'not_created.md':
-            new_link = f']({html_url_prefix}/not_created.html)'
-        else:
-            if link.fo is None:
-                continue
+            return f']({html_url_prefix}/not_created.html)'
 
-            md.links.append(link.fo)
+        if link.fo is None:
+            return m.group(0)
 
-            # [11.1] Rewrite .md links to .html (when the link is to a file in our root folder)
-            query_part = ''
-            if link.query != '':
-                query_part = link.query_delimiter + link.query 
-            new_link = f']({urllib.parse.quote(link.fo.get_link("html", origin=fo))}{query_part})'
+        md.links.append(link.fo)
 
-        # Update link
-        safe_link = re.escape(']('+ol+')')
-        md.page = re.sub(safe_link, new_link, md.page)
+        # [11.1] Rewrite .md links to .html (when the link is to a file in our root folder)
+        query_part = ''
+        if link.query != '':
+            query_part = link.query_delimiter + link.query 
+        return f']({urllib.parse.quote(link.fo.get_link("html", origin=fo))}{query_part})'
+
+    md.page = MarkdownLinkRegex.sub(convert_markdown_link, md.page)
 
     # [4] Handle local image links (copy them over to output)
     # ------------------------------------------------------------------
-    for link in re.findall(r'\!\[.*?\]\((.*?)\)', md.page):
-        
+    def convert_image_link(m):
+        link = m.group(1)
         l = urllib.parse.unquote(link)
 
         if l[0] == '/':
@@ -699,89 +1049,40 @@ def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=
         if rel_path_str == False:
             if pb.gc('toggles/warn_on_skipped_image', cached=True):
                 warnings.warn(f"Image {l} treated as external and not imported in html")
-            continue
+            return m.group(0)
 
         # Copy src to dst
         link_fo.copy_file('mth')
 
         # [11.2] Adjust image link in page to new dst folder (when the link is to a file in our root folder)
-        new_link = '![]('+urllib.parse.quote(link_fo.get_link('html', origin=fo))+')'
-        safe_link = r"\!\[.*\]\("+re.escape(link)+r"\)"
-        md.page = re.sub(safe_link, new_link, md.page)
-
-    # [?] Handle local source tag-links (copy them over to output)
-    # ------------------------------------------------------------------
-    for link in re.findall(r'(?<=<source src=")([^"]*)', md.page):
-        l = urllib.parse.unquote(link)
-        if '://' in l:
-            continue
-
-        rel_path_str, lo = FindFile(pb.index.files, l, pb)
-        if rel_path_str == False:
-            if pb.gc('toggles/warn_on_skipped_image', cached=True):
-                warnings.warn(f"Media {l} treated as external and not imported in html")
-            continue
-
-        # Copy src to dst
-        lo.copy_file('mth')
+        return '![]('+urllib.parse.quote(link_fo.get_link('html', origin=fo))+')'
 
-        # [11.2] Adjust video link in page to new dst folder (when the link is to a file in our root folder)
-        new_link = '<source src="'+urllib.parse.quote(lo.get_link('html', origin=fo))+'"'
-        safe_link = r'<source src="'+re.escape(link)+r'"'
-        md.page = re.sub(safe_link, new_link, md.page)
+    md.page = HtmlImageLinkRegex.sub(convert_image_link, md.page)
 
-    # [?] Handle local img tag-links (copy them over to output)
+    # [?] Handle local media tag-links (<source src="">, <img src="">, <embed src="">), copy them over to output
     # ------------------------------------------------------------------
-    for tag in re.findall(r'<img src=".*?>', md.page):
-
-        # get template and link from tag
+    def convert_media_tag(m):
         # e.g. <img src="200w.gif"  width="200"> --> <img src="{link}"  width="200"> & 200w.gif
-        parts = tag.split('src="')
-        iparts = parts[1].split('"', 1)
-        link = iparts[0]
-        template = parts[0] + 'src="{link}"' + iparts[1]
-
+        link = m.group('link')
         l = urllib.parse.unquote(link)
         if '://' in l:
-            continue
-
+            return m.group(0)
 
         rel_path_str, lo = FindFile(pb.index.files, l, pb)
         if rel_path_str == False:
             if pb.gc('toggles/warn_on_skipped_image', cached=True):
                 warnings.warn(f"Media {l} treated as external and not imported in html")
-            continue
+            return m.group(0)
 
         # Copy src to dst
         lo.copy_file('mth')
 
-        # [11.2] Adjust video link in page to new dst folder (when the link is to a file in our root folder)
-        new_link = template.replace('{link}', urllib.parse.quote(lo.get_link('html', origin=fo)))
-        safe_link = re.escape(tag)
-        print(2, new_link)
-        print(3, safe_link)
-        md.page = re.sub(safe_link, new_link, md.page)
-
-    # [?] Handle local embeddable tag-links (copy them over to output)
-    # ------------------------------------------------------------------
-    for link in re.findall(r'(?<=<embed src=")([^"]*)', md.page):
-        l = urllib.parse.unquote(link)
-        if '://' in l:
-            continue
-
-        rel_path_str, lo = FindFile(pb.index.files, l, pb)
-        if rel_path_str == False:
-            if pb.gc('toggles/warn_on_skipped_image', cached=True):
-                warnings.warn(f"Media {l} treated as external and not imported in html")
-            continue
-
-        # Copy src to dst
-        lo.copy_file('mth')
+        # [11.2] Adjust media link in page to new dst folder (when the link is to a file in our root folder)
+        return m.group('start') + urllib.parse.quote(lo.get_link('html', origin=fo)) + m.group('end')
 
-        # [11.2] Adjust video link in page to new dst folder (when the link is to a file in our root folder)
-        new_link = '<embed src="'+urllib.parse.quote(lo.get_link('html', origin=fo))+'"'
-        safe_link = r'<embed src="'+re.escape(link)+r'"'
-        md.page = re.sub(safe_link, new_link, md.page)
+    md.page = HtmlSourceTagRegex.sub(convert_media_tag, md.page)
+    md.page = HtmlImgTagRegex.sub(convert_media_tag, md.page)
+    md.page = HtmlEmbedTagRegex.sub(convert_media_tag, md.page)
 
     # [?] Documentation styling: Table of Contents
     # ------------------------------------------------------------------
@@ -792,16 +1093,9 @@ def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=
     if gc_add_toc_when_missing(pb, fo):
         if '[TOC]' not in md.page:
             # if h1 is present, place toc after the first h1, else put it at the top of the page.
-            output = ''
-            found_h1 = False
-            for line in md.page.split('\n'):
-                output += line + '\n'
-                if found_h1 == False and line.startswith('# '):
-                    output += '\n[TOC]\n\n'
-                    found_h1 = True
-            
-            if found_h1:
-                md.page = output
+            h1_end = fo.get_section_index(md.page).find_h1_line_end()
+            if h1_end is not None:
+                md.page = md.page[:h1_end] + '\n\n[TOC]\n\n' + md.page[h1_end+1:] + ('\n' if h1_end < len(md.page) else '')
             else: 
                 md.page = '\n[TOC]\n\n' + md.page
 
@@ -809,17 +1103,18 @@ def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=
     # Cannot start with [, (, nor "
     # match 'http://* ' or 'https://* ' (end match by whitespace)
     # Note that note->md step also does this, this should be void if doing note-->html, but useful when doing md->html
-    for l in re.findall("(?<![\[\(\"])https*:\/\/.[^\s|\"]*(?!.*\">)", md.page):
-        new_md_link = f"[{l}]({l})"
-        safe_link = re.escape(l)
-        md.page = re.sub(f"(?<![\[\(])({safe_link})", new_md_link, md.page)
+    md.page = replace_literals(md.page, BareUrlRegex.findall(md.page), lambda l: f"[{l}]({l})", lookbehind=r'(?<![\[\(])')
 
     # [1] Restore codeblocks/-lines
     # ------------------------------------------------------------------
     md.RestoreCodeSections()
 
-    # [11] Convert markdown to html
-    # ------------------------------------------------------------------
+def get_markdown_engine(pb):
+    ''' Returns the markdown.Markdown instance that converts the notes to html. Setting up the extensions is relatively expensive, 
+        so the instance is created once per process and reset() between notes. '''
+    if pb.markdown_engine is not None:
+        return pb.markdown_engine
+
     extensions = [
         'abbr', 'attr_list', 'def_list', 
         'fenced_code', 'tables',
@@ -838,7 +1133,6 @@ def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=
     if pb.gc('toggles/features/dataview/enabled'):
         extensions.append('dataview')
         extension_configs['dataview'] = {
-            'note_path': rel_dst_path,
             'dataview_export_folder': pb.paths['dataview_export_folder']
         }
         
@@ -852,8 +1146,24 @@ def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=
     extensions.append(AdmonitionExtension())
     #extensions.append('custom_tables')
 
+    pb.markdown_engine = markdown.Markdown(extensions=extensions, extension_configs=extension_configs)
+    return pb.markdown_engine
 
-    html_body = markdown.markdown(md.page, extensions=extensions, extension_configs=extension_configs)
+@extra_info()
+def convert_markdown_page_to_html(fo:'FileObject', md, node, pb, capture_in_jar=False):
+    '''This function converts a prepared markdown page to html and keeps the result in pb.deferred_html. Placeholders are left for the second pass.
+       Apart from pb.jars, no shared state is changed, so that this function can also be run in a worker process (see render_queued_pages()).'''
+
+    rel_dst_path = fo.path['html']['file_relative_path']
+    html_url_prefix = pb.gc('html_url_prefix')
+    page_depth = len(rel_dst_path.as_posix().split('/')) - 1
+
+    # [11] Convert markdown to html
+    # ------------------------------------------------------------------
+    md_engine = get_markdown_engine(pb)
+    md_engine.reset()
+    md_engine.note_path = rel_dst_path      # per note settings of the extensions, see DataviewExtension
+    html_body = md_engine.convert(md.page)
     html_body = f'<div class="content">{html_body}</div>'
 
     if (capture_in_jar):
@@ -874,8 +1184,7 @@ def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=
         # hide if h1 is present
         hide = False
         if 'hideOnH1' in pb.config.plugin_settings['embedded_note_titles'].keys() and pb.config.plugin_settings['embedded_note_titles']['hideOnH1']:
-            header_dict, root_element = ConvertMarkdownToHeaderTree(md.page)
-            if len(root_element['content']) > 0 and isinstance(root_element['content'][0], dict) and root_element['content'][0]['level'] == 1:
+            if fo.get_section_index(md.page).starts_with_h1():
                 hide = True
 
         # hideOnMetadataField
@@ -958,33 +1267,12 @@ def crawl_markdown_notes_and_convert_to_html(fo:'FileObject', pb, backlink_node=
     # ------------------------------------------------------------------
     html = html.replace('{{navbar_links}}', '\n'.join(pb.navbar_links))  
 
-    # Save file
+    # Keep html for the second pass, which writes the file
     # ------------------------------------------------------------------
+    # (the folder is created already, so that it is found when indexing the output folder)
     fo.path['html']['file_absolute_path'].parent.mkdir(parents=True, exist_ok=True)   
-    html_dst_path_posix = fo.path['html']['file_absolute_path'].as_posix()
-
-    md.AddToTagtree(pb.tagtree, fo.path['html']['file_relative_path'].as_posix())
-
-    # Write html
-    with open(html_dst_path_posix, 'w', encoding="utf-8") as f:
-        f.write(html)
-
-    # Set file to processed
-    fo.processed_mth = True
-
-    # > Done with this markdown page!
+    pb.deferred_html.add(fo, html)
 
-    # Recurse for every link in the current page
-    # ------------------------------------------------------------------
-    for link_fo in md.links:
-        if not link_fo.is_valid_note('markdown'):
-            continue
-
-        # Convert the note that is linked to
-        if pb.gc('toggles/verbose_printout', cached=True):
-            print('\t'*(log_level+1), f"html: initiating conversion for {link_fo.fullpath('markdown')} (parent {fo.fullpath('markdown')})")
-
-        pb.init_state(action='m2h', loop_type='md_note', current_fo=link_fo, subroutine='crawl_markdown_notes_and_convert_to_html')
-        crawl_markdown_notes_and_convert_to_html(link_fo, pb, backlink_node, log_level=log_level)
-        pb.reset_state()
+    # Keep a copy for the second pass of the next (incremental) build
+    pb.manifest.store_first_pass_html(fo, html)
 
@@ -1,18 +1,31 @@
 import os
 import sys
+import hashlib
+import threading
 import http.server
-import socketserver
+import urllib.parse
 from pathlib import Path
+from functools import lru_cache
 
 # Defer tools
 from contextlib import ExitStack
 from functools import partial
 
+# Pages that are served with `serve --live` listen on this url for server-sent events
+LIVE_RELOAD_PATH = '/obs.html/live-reload'
+LIVE_RELOAD_SCRIPT = ("<script>new EventSource('" + LIVE_RELOAD_PATH + "?page=' + encodeURIComponent(location.pathname))"
+                      ".onmessage = function(e) { if (e.data == 'reload') { location.reload(); } };</script>")
+
 def ServeDir(port=8888, directory='./'):
+    live = False
+
     # Get directory/port from commandline args if provided
     if len(sys.argv) > 2:
         if sys.argv[1] == 'serve':
             for i, v in enumerate(sys.argv):
+                if v == '--live':
+                    live = True
+
                 if v == '--directory':
                     if len(sys.argv) < (i + 2):
                         print(f'No directory path given for serve.\n  Use `obsidianhtml serve --directory /target/path/to/html/folder` to provide input.')
@@ -25,13 +38,33 @@ def ServeDir(port=8888, directory='./'):
                         exit(1)
                     port = sys.argv[i+1]
 
+    if live:
+        return ServeLive(port)
+
     if not Path(directory).resolve().exists():
         print(f'Configured directory of {directory} does not exist.')
         exit(1)
 
+    # configure server
+    Handler = get_handler(directory)
+
+    # start server
+    print(f'OBSHTML: Started webserver at http://localhost:{port}/ hosting from {Path(directory).resolve().as_posix()} (Ctrl+C to exit)', flush=True)
+    httpd = http.server.ThreadingHTTPServer(("", int(port)), Handler)
+
+    with ExitStack() as stack:
+        stack.callback(partial(httpd.server_close))
+        stack.callback(partial(print, 'DEFERRED: closed webserver', flush=True))
+
+        httpd.serve_forever()
+
+def get_handler(directory, base=None):
+    if base is None:
+        base = StaticHandler
+
     # We do this trickery so that we can set Handler.directory without having the init method overwrite our setting.
     # (Handler.init() is called somewhere out of our control)
-    class BetterHandler(http.server.SimpleHTTPRequestHandler):
+    class BetterHandler(base):
         def __init__(self, *args, **kwargs):
             if self.directory is None:
                 self.directory = os.getcwd()
@@ -39,20 +72,297 @@ def ServeDir(port=8888, directory='./'):
             self.directory = os.fspath(self.directory)
             super(http.server.SimpleHTTPRequestHandler, self).__init__(*args, **kwargs)
 
-    # configure server
     Handler = BetterHandler
     Handler.directory = Path(directory).resolve().as_posix()
     Handler.extensions_map.update({
         ".js": "application/javascript",
     })
+    return Handler
 
-    # start server
-    print(f'OBSHTML: Started webserver at http://localhost:{port}/ hosting from {Path(directory).resolve().as_posix()} (Ctrl+C to exit)', flush=True)
-    httpd = socketserver.TCPServer(("", int(port)), Handler)
+def ServeLive(port):
+    ''' Converts the vault and serves the output. The vault is converted again when it changes (see Watch), 
+        after which the pages that are open in the browser and that have changed are reloaded. '''
+    from .Watch import Watch
 
-    with ExitStack() as stack:
-        stack.callback(partial(httpd.server_close))
-        stack.callback(partial(print, 'DEFERRED: closed webserver', flush=True))
+    reloader = LiveReload()
+    def on_build(pb):
+        if reloader.server is not None:
+            reloader.notify()
+            return
 
-        httpd.serve_forever()
+        # serve the folder that the html_url_prefix is relative to
+        directory = pb.paths['html_output_folder']
+        html_url_prefix = pb.gc('html_url_prefix').strip('/')
+        if html_url_prefix != '' and directory.as_posix().endswith('/' + html_url_prefix):
+            directory = directory.parents[len(html_url_prefix.split('/')) - 1]
+
+        Handler = get_handler(directory, base=LiveHandler)
+        Handler.reloader = reloader
+        reloader.server = http.server.ThreadingHTTPServer(("", int(port)), Handler)
+        reloader.server.daemon_threads = True
+        threading.Thread(target=reloader.server.serve_forever, daemon=True).start()
+        print(f'OBSHTML: Started webserver at http://localhost:{port}/ hosting from {directory.as_posix()}, pages reload when they are converted again (Ctrl+C to exit)', flush=True)
+
+    try:
+        Watch(on_build=on_build)
+    finally:
+        if reloader.server is not None:
+            reloader.server.shutdown()
+            reloader.server.server_close()
+            print('DEFERRED: closed webserver', flush=True)
+
+class LiveReload:
+    ''' Keeps track of the builds, so that the live reload requests know when to check whether their page has changed '''
+    server = None
+
+    def __init__(self):
+        self.build = 0
+        self.condition = threading.Condition()
+
+    def notify(self):
+        with self.condition:
+            self.build += 1
+            self.condition.notify_all()
+
+    def wait(self, build, timeout):
+        ''' Returns the number of the latest build, as soon as it differs from the given build or the timeout has passed '''
+        with self.condition:
+            self.condition.wait_for(lambda: self.build != build, timeout)
+            return self.build
+
+@lru_cache(maxsize=256)
+def get_live_page(path_str, mtime_ns, size):
+    ''' Returns the html page with the live reload script added. Cached on the stat signature of the file, so that unchanged pages are not read again. '''
+    with open(path_str, 'r', encoding='utf-8') as f:
+        html = f.read()
+
+    pos = html.rfind('</body>')
+    if pos == -1:
+        html += LIVE_RELOAD_SCRIPT
+    else:
+        html = html[:pos] + LIVE_RELOAD_SCRIPT + html[pos:]
+    return html.encode('utf-8')
+
+def get_stat_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+@lru_cache(maxsize=4096)
+def get_etag(path_str, mtime_ns, size):
+    ''' Strong ETag based on the contents of the file. Cached on the stat signature of the file, so that files are only hashed again when they change. '''
+    h = hashlib.sha1()
+    with open(path_str, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return f'"{h.hexdigest()}"'
+
+class StaticHandler(http.server.SimpleHTTPRequestHandler):
+    ''' SimpleHTTPRequestHandler with HTTP/1.1 keep-alive, ETags, Range requests and precompressed files:
+        when the client accepts it, file.br or file.gz is sent instead of file (with the matching Content-Encoding). '''
+    protocol_version = 'HTTP/1.1'
+    timeout = 60                    # close idle keep-alive connections
+    encodings = (('br', '.br'), ('gzip', '.gz'))
+    remaining = None                # number of bytes of the file that still have to be sent (see copyfile)
+
+    def send_head(self):
+        self.remaining = None
+
+        # directories (redirects, index.html, listings), missing files, etc. are handled as before
+        path = self.translate_path(self.path)
+        url_path = urllib.parse.urlsplit(self.path).path
+        if url_path.endswith('/') and not os.path.isdir(path):
+            return super().send_head()
+        if os.path.isdir(path):
+            if not url_path.endswith('/'):
+                return super().send_head()
+            for index in ('index.html', 'index.htm'):
+                if os.path.isfile(os.path.join(path, index)):
+                    path = os.path.join(path, index)
+                    break
+            else:
+                return super().send_head()
+        if not os.path.isfile(path):
+            return super().send_head()
+
+        ctype = self.guess_type(path)
+
+        # use precompressed file if available and accepted
+        encoding = None
+        has_variants = False
+        accepted = self.get_accepted_encodings()
+        for enc, suffix in self.encodings:
+            if os.path.isfile(path + suffix):
+                has_variants = True
+                if encoding is None and enc in accepted:
+                    encoding = enc
+                    path = path + suffix
+
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(http.HTTPStatus.NOT_FOUND, "File not found")
+            return None
+
+        try:
+            fs = os.fstat(f.fileno())
+            size = fs.st_size
+            etag = get_etag(path, fs.st_mtime_ns, size)
+
+            # Conditional request
+            if_none_match = self.headers.get('If-None-Match')
+            if if_none_match is not None and (if_none_match.strip() == '*' or etag in [x.strip() for x in if_none_match.split(',')]):
+                self.send_response(http.HTTPStatus.NOT_MODIFIED)
+                self.send_header('ETag', etag)
+                if has_variants:
+                    self.send_header('Vary', 'Accept-Encoding')
+                self.end_headers()
+                f.close()
+                return None
+
+            # Range request (only a single range is supported, otherwise the whole file is sent)
+            start, end = 0, size - 1
+            status = http.HTTPStatus.OK
+            byte_range = self.headers.get('Range')
+            if_range = self.headers.get('If-Range')
+            if byte_range is not None and (if_range is None or if_range.strip() == etag):
+                parsed = self.parse_range(byte_range, size)
+                if parsed is False:
+                    self.send_response(http.HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    f.close()
+                    return None
+                if parsed is not None:
+                    start, end = parsed
+                    status = http.HTTPStatus.PARTIAL_CONTENT
+
+            self.send_response(status)
+            self.send_header('Content-Type', ctype)
+            if encoding is not None:
+                self.send_header('Content-Encoding', encoding)
+            if has_variants:
+                self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', self.date_time_string(fs.st_mtime))
+            if status == http.HTTPStatus.PARTIAL_CONTENT:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+
+            f.seek(start)
+            self.remaining = end - start + 1
+            return f
+        except:
+            f.close()
+            raise
+
+    def get_accepted_encodings(self):
+        accepted = set()
+        for part in self.headers.get('Accept-Encoding', '').split(','):
+            values = [x.strip() for x in part.split(';')]
+            if values[0] == '':
+                continue
+            if any([x.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000') for x in values[1:]]):
+                continue
+            accepted.add(values[0].lower())
+        return accepted
+
+    def parse_range(self, byte_range, size):
+        ''' Returns (start, end) for a single "bytes=" range, None when the range should be ignored, and False when it can't be satisfied '''
+        unit, _, ranges = byte_range.partition('=')
+        if unit.strip() != 'bytes' or ',' in ranges:
+            return None
+        first, _, last = ranges.strip().partition('-')
+        try:
+            if first == '':
+                # suffix range: the last n bytes
+                length = int(last)
+                if length == 0:
+                    return False
+                return (max(0, size - length), size - 1)
+            start = int(first)
+            end = int(last) if last != '' else size - 1
+        except ValueError:
+            return None
+        if start >= size or end < start:
+            return False
+        return (start, min(end, size - 1))
+
+    def copyfile(self, source, outputfile):
+        # only send the requested range
+        remaining = self.remaining
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        while remaining > 0:
+            chunk = source.read(min(64 * 1024, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+        self.remaining = None
+
+class LiveHandler(StaticHandler):
+    reloader = None
+
+    def get_page_path(self, url_path):
+        ''' Returns the path of the html file that is served for the url, or None if it is not a html page '''
+        path = self.translate_path(url_path)
+        if os.path.isdir(path):
+            path = os.path.join(path, 'index.html')
+        if not path.endswith('.html') or not os.path.isfile(path):
+            return None
+        return path
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == LIVE_RELOAD_PATH:
+            page = urllib.parse.parse_qs(url.query).get('page', ['/'])[0]
+            return self.send_live_reload_events(page)
+
+        path = self.get_page_path(self.path)
+        if path is None or (os.path.isdir(self.translate_path(self.path)) and not url.path.endswith('/')):
+            return super().do_GET()
+
+        signature = get_stat_signature(path)
+        if signature is None:
+            return super().do_GET()
+        body = get_live_page(path, *signature)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_live_reload_events(self, page):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')         # the event stream ends when the connection is closed
+        self.end_headers()
+
+        path = self.get_page_path(page)
+        signature = get_stat_signature(path) if path is not None else None
+        build = self.reloader.build
+        try:
+            while True:
+                latest_build = self.reloader.wait(build, timeout=15)
+                if latest_build == build:
+                    # comment line, so that we find out when the browser has gone away
+                    self.wfile.write(b': keep-alive\n\n')
+                    self.wfile.flush()
+                    continue
+                build = latest_build
 
+                if path is None or get_stat_signature(path) != signature:
+                    self.wfile.write(b'data: reload\n\n')
+                    self.wfile.flush()
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return
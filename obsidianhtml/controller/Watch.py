@@ -0,0 +1,101 @@
+import sys
+import time
+import traceback
+
+from .ConvertVault import ConvertVault
+
+from ..lib import CreateStaticFilesFolders, PathMatcher
+from ..core.ConfigManager import Config
+from ..core.FileWatcher import FileWatcher
+from ..features.CopyVault import SyncTemporaryCopy
+from ..features.SidePane import get_html_page_content, gc_add_toc_when_missing
+
+def Watch(on_build=None):
+    ''' Converts the vault, and then converts it again whenever something in the vault changes.
+        Builds are always incremental, so only the notes that are affected by a change are converted again.
+        The copy of the vault (copy_vault_to_tempdir) is made once, after that only the changed files are copied over. 
+        on_build(pb) is called after every successful build (used by `serve --live`). '''
+    # Get settings from commandline args
+    use_inotify = True
+    interval = 0.5
+    debounce = 0.2
+    for i, v in enumerate(sys.argv):
+        if v == '--poll':
+            use_inotify = False
+        if v in ('--interval', '--debounce'):
+            if len(sys.argv) < (i + 2):
+                print(f'No value given for {v}.\n  Use `obsidianhtml watch -i config.yml {v} 0.5` to provide input.')
+                exit(1)
+            if v == '--interval':
+                interval = float(sys.argv[i+1])
+            else:
+                debounce = float(sys.argv[i+1])
+
+    # Initial build
+    pb, vault_copy = ConvertVault(force_incremental_build=True)
+    if on_build is not None:
+        on_build(pb)
+
+    # Watch the vault, or the markdown folder when converting from markdown
+    source_folder = pb.paths['original_obsidian_folder']
+    if not pb.gc('toggles/compile_md'):
+        source_folder = pb.paths['md_folder']
+
+    ignore = IgnoredPaths(pb, source_folder)
+    watcher = FileWatcher(source_folder, ignore=ignore, interval=interval, use_inotify=use_inotify)
+
+    while True:
+        print(f'\n> WATCHING {source_folder} for changes (using {watcher.method}, Ctrl+C to exit)', flush=True)
+        changed = watcher.wait_for_changes(debounce)
+
+        print(f'> WATCH: {len(changed)} change(s) detected, converting vault')
+        if pb.verbose:
+            for path in sorted(changed):
+                print(f'\t{path}')
+
+        start = time.time()
+        clear_build_caches()
+        try:
+            if vault_copy is not None:
+                vault_copy = SyncTemporaryCopy(source_folder, vault_copy, changed, ignore, pb)
+            pb, vault_copy = ConvertVault(vault_copy=vault_copy, force_incremental_build=True)
+        except Exception:
+            traceback.print_exc()
+            print('> WATCH: Conversion failed, waiting for the next change')
+            continue
+
+        ignore.update(pb)
+        print(f'> WATCH: Done in {time.time() - start:.2f}s')
+        if on_build is not None:
+            on_build(pb)
+
+class IgnoredPaths:
+    ''' Changes to these paths should not trigger a new build: excluded files and folders (exclude_glob), and any output folder that is in the vault.
+        Call the object with a path to find out whether it is ignored. '''
+    def __init__(self, pb, source_folder):
+        self.source_folder = source_folder
+        self.update(pb)
+
+    def update(self, pb):
+        ''' The config is loaded again for every build, so the paths to ignore can change '''
+        self.matcher = PathMatcher(pb.gc('exclude_glob'))
+        self.folders = []
+        for key in ('html_output_folder', 'build_cache_folder', 'log_output_folder', 'dataview_export_folder'):
+            if key in pb.paths:
+                self.folders.append(pb.paths[key])
+        if pb.gc('toggles/compile_md'):
+            self.folders.append(pb.paths['md_folder'])
+
+    def __call__(self, path):
+        if self.matcher.match_path(path, self.source_folder):
+            return True
+        for folder in self.folders:
+            if path == folder or path.is_relative_to(folder):
+                return True
+        return False
+
+def clear_build_caches():
+    ''' Some functions are cached for the duration of a build. Clear them, as we run multiple builds in the same process. '''
+    for func in (CreateStaticFilesFolders, get_html_page_content, gc_add_toc_when_missing,
+                 Config._get_config_cached, Config._feature_is_enabled_cached, Config.ShowIcon):
+        func.cache_clear()
@@ -31,6 +31,10 @@ class Optional:
     def remove_previous_obsidianhtml_output(pb) -> T.SystemChange:
         ''' Cleanup the result of the previous run (md and html folders) '''
 
+        if pb.manifest is not None and pb.manifest.usable:
+            print('> KEEPING OUTPUT FOLDERS (incremental build)')
+            return
+
         if pb.gc('toggles/no_clean', cached=True) == False:
             print('> CLEARING OUTPUT FOLDERS')
             if pb.gc('toggles/compile_md', cached=True):
@@ -0,0 +1,314 @@
+import os
+import json
+import hashlib
+
+from ..lib import OpenIncludedFile
+
+from . import Types as T
+
+'''
+The build manifest makes incremental builds possible (toggles/incremental_build).
+
+After every build, a manifest is written to build_cache_folder_path_str that records for each file in the index:
+- its content hash, mtime and size
+- the links, inclusions, copied attachments and leaf_note status found while converting it to markdown ('ntm')
+- the hash of the markdown it was rendered from, its graph node id, its links, copied attachments and tags ('mth')
+
+Next to the manifest the first-pass html of every rendered note is kept (the html before the second pass
+fills in backlinks, side panes, tag footers, breadcrumbs and embedded search results).
+
+On the next run, a note is only converted again when its content, the content of the notes it includes,
+or the set of files in the vault changed. The second pass is always run for every note, because it is the
+part of the output that depends on other notes, but html files are only written when their content actually
+changed, so that unaffected files are left alone.
+
+Any change in the config, the html templates, or the obsidianhtml version will trigger a full rebuild.
+'''
+
+def hash_file(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def hash_text(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+class BuildManifest:
+    pb = None
+    enabled = False             # toggles/incremental_build
+    usable = False              # whether the previous build can be built upon
+    previous = None             # manifest of the previous build
+    current = None              # manifest of the current build, written on finalize()
+    stats = None
+
+    def __init__(self, pb):
+        self.pb = pb
+        self.pb.manifest = self
+
+        self.previous = {'files': {}, 'file_keys': []}
+        self.current = {'files': {}}
+        self.signatures = {}
+        self.copied = {'ntm': set(), 'mth': set()}      # attachments copied during this build
+        self.needed = {'ntm': set(), 'mth': set()}      # attachments linked to by the notes in this build
+        self.pending_copies = set()
+        self._fileset_changed = None
+        self.stats = {'ntm_reused': 0, 'ntm_converted': 0, 'mth_reused': 0, 'mth_converted': 0, 'html_unchanged': 0}
+
+        self.enabled = pb.gc('toggles/incremental_build', cached=True)
+        if not self.enabled:
+            return
+
+        self.folder = pb.paths['build_cache_folder']
+        self.manifest_path = self.folder.joinpath('manifest.json')
+        self.html_cache_folder = self.folder.joinpath('html')
+
+        self.current['version'] = OpenIncludedFile('version')
+        self.current['fingerprint'] = self.compile_fingerprint()
+
+        self.load()
+
+    def compile_fingerprint(self):
+        ''' Anything that is not a note, but that does influence every page, should go in here '''
+        pb = self.pb
+        config = {k: v for k, v in pb.config.config.items() if k != 'jobs'}     # does not influence the output
+        parts = [
+            json.dumps(config, sort_keys=True, default=str),
+            pb.html_template or '',
+            getattr(pb, 'graph_template', '') or '',
+        ]
+        return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def load(self):
+        if not self.manifest_path.exists():
+            print('> INCREMENTAL BUILD: No previous build manifest found, doing a full build')
+            return
+
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+
+        if previous.get('version') != self.current['version']:
+            print('> INCREMENTAL BUILD: Obsidianhtml version changed, doing a full build')
+            return
+        if previous.get('fingerprint') != self.current['fingerprint']:
+            print('> INCREMENTAL BUILD: Config or templates changed, doing a full build')
+            return
+
+        print(f'> INCREMENTAL BUILD: Building upon previous build ({self.manifest_path})')
+        self.previous = previous
+        self.usable = True
+
+    # Change detection
+    # ---------------------------------------------------------
+    def get_source_path(self, fo):
+        if 'note' in fo.path.keys():
+            return fo.path['note']['file_absolute_path']
+        return fo.path['markdown']['file_absolute_path']
+
+    def get_signature(self, fo):
+        ''' Returns the mtime, size and content hash of the source file.
+            The content is only hashed again when the mtime or size differ from the previous build. '''
+        if fo.key in self.signatures:
+            return self.signatures[fo.key]
+
+        path = self.get_source_path(fo)
+        st = os.stat(path)
+        signature = {'mtime': st.st_mtime_ns, 'size': st.st_size}
+
+        prev = self.previous['files'].get(fo.key)
+        if prev is not None and prev['mtime'] == signature['mtime'] and prev['size'] == signature['size']:
+            signature['hash'] = prev['hash']
+        else:
+            signature['hash'] = hash_file(path)
+
+        self.signatures[fo.key] = signature
+        return signature
+
+    def has_changed(self, key):
+        files = self.pb.index.files
+        prev = self.previous['files'].get(key)
+        if prev is None or key not in files:
+            return True
+        return self.get_signature(files[key])['hash'] != prev['hash']
+
+    def get_markdown_hash(self, fo):
+        # (fused pipeline) the markdown file might still be being written
+        if fo.converted_md is not None:
+            return fo.converted_md['hash']
+        return hash_file(fo.path['markdown']['file_absolute_path'])
+
+    def fileset_changed(self):
+        ''' Links are resolved against all the files in the vault, so adding or removing any file can change the output of any note '''
+        if self._fileset_changed is None:
+            self._fileset_changed = (sorted(self.pb.index.files.keys()) != self.previous['file_keys'])
+            if self._fileset_changed:
+                print('\tINCREMENTAL BUILD: Files were added or removed, all notes will be converted')
+        return self._fileset_changed
+
+    def is_clean(self, fo, stage, node=None):
+        ''' Returns True when the output of the previous build for the given stage ('ntm' or 'mth') can be reused '''
+        if not self.usable or self.fileset_changed():
+            return False
+
+        prev = self.previous['files'].get(fo.key)
+        if prev is None or stage not in prev:
+            return False
+
+        if stage == 'ntm':
+            if self.has_changed(fo.key):
+                return False
+            for key in prev['ntm']['inclusions']:
+                if self.has_changed(key):
+                    return False
+            return fo.path['markdown']['file_absolute_path'].exists()
+
+        if stage == 'mth':
+            # dataview output depends on the vault as a whole
+            if self.pb.gc('toggles/features/dataview/enabled', cached=True):
+                return False
+            if prev['mth']['nid'] != node['nid']:
+                return False
+            if prev['mth']['md_hash'] != self.get_markdown_hash(fo):
+                return False
+            return self.get_first_pass_html_path(fo).exists() and fo.path['html']['file_absolute_path'].exists()
+
+        raise Exception(f'Unknown build stage {stage}')
+
+    # Recording
+    # ---------------------------------------------------------
+    def add_copy(self, fo, mode):
+        ''' Called by FileObject.copy_file(), the copy is attributed to the note that is being converted '''
+        self.copied[mode].add(fo.key)
+        self.pending_copies.add(fo.key)
+
+    def record(self, fo, stage, **kwargs):
+        ''' Records the result of converting the note, call directly after the conversion '''
+        copies, self.pending_copies = self.pending_copies, set()
+        if not self.enabled:
+            return
+        self.stats[f'{stage}_converted'] += 1
+
+        if stage == 'mth':
+            kwargs['md_hash'] = self.get_markdown_hash(fo)
+        kwargs['links'] = [x.key for x in kwargs['links'] if x != False]
+        kwargs['copies'] = sorted(copies)
+        self.needed[stage].update(copies)
+
+        self.current['files'].setdefault(fo.key, {})[stage] = kwargs
+
+    def reuse(self, fo, stage):
+        ''' Carries over the record of the previous build and returns it '''
+        self.stats[f'{stage}_reused'] += 1
+        record = self.previous['files'][fo.key][stage]
+        self.current['files'].setdefault(fo.key, {})[stage] = record
+        self.needed[stage].update(record['copies'])
+        return record
+
+    def get_links(self, record):
+        files = self.pb.index.files
+        return [files[x] for x in record['links'] if x in files]
+
+    # Output
+    # ---------------------------------------------------------
+    def get_first_pass_html_path(self, fo):
+        return self.html_cache_folder.joinpath(fo.path['html']['file_relative_path'])
+
+    def store_first_pass_html(self, fo, html):
+        if not self.enabled:
+            return
+        path = self.get_first_pass_html_path(fo)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding="utf-8") as f:
+            f.write(html)
+
+    def load_first_pass_html(self, fo):
+        with open(self.get_first_pass_html_path(fo), 'r', encoding="utf-8") as f:
+            return f.read()
+
+    def write_html(self, path, html) -> T.SystemChange:
+        ''' Writes the html to the output file, unless the output file already contains exactly this html '''
+        if self.enabled and path.exists():
+            with open(path, 'r', encoding="utf-8") as f:
+                if f.read() == html:
+                    self.stats['html_unchanged'] += 1
+                    return
+        with open(path, 'w', encoding="utf-8") as f:
+            f.write(html)
+
+    def get_output_path(self, entry, stage):
+        if stage == 'ntm':
+            return self.pb.paths['md_folder'].joinpath(entry['md_path'])
+        return self.pb.paths['html_output_folder'].joinpath(entry['html_path'])
+
+    def remove_file(self, path, root) -> T.SystemChange:
+        ''' Removes the file, and any parent folders (up to root) that are empty afterwards '''
+        if not path.exists():
+            return
+        if self.pb.gc('toggles/verbose_printout', cached=True):
+            print(f'\tINCREMENTAL BUILD: Removing stale output {path}')
+        path.unlink()
+        self.pb.index.forget_file(path)
+
+        folder = path.parent
+        while folder != root and folder.is_relative_to(root) and not any(folder.iterdir()):
+            folder.rmdir()
+            folder = folder.parent
+
+    def remove_stale_output(self, stage) -> T.SystemChange:
+        ''' Brings the output folder of the given stage in line with this build:
+            - Removes the output of notes that were built in the previous run, but not in this one (e.g. because they were deleted)
+            - Copies over attachments of reused notes that have changed since the previous build, or that went missing
+            - Removes copies of attachments that are no longer linked to
+        '''
+        if not self.usable:
+            return
+
+        files = self.pb.index.files
+        root = self.pb.paths['md_folder'] if stage == 'ntm' else self.pb.paths['html_output_folder']
+
+        previously_copied = set()
+        for key, prev in self.previous['files'].items():
+            if stage not in prev:
+                continue
+            previously_copied.update(prev[stage]['copies'])
+            if stage in self.current['files'].get(key, {}):
+                continue
+
+            self.remove_file(self.get_output_path(prev, stage), root)
+            if stage == 'mth':
+                self.remove_file(self.html_cache_folder.joinpath(prev['html_path']), self.html_cache_folder)
+
+        # Attachments of reused notes
+        for key in sorted(self.needed[stage] - self.copied[stage]):
+            if key not in files:
+                continue
+            if self.has_changed(key) or not self.get_output_path(self.previous['files'][key], stage).exists():
+                files[key].copy_file(stage)
+        self.pending_copies = set()
+
+        # Attachments that are not linked to anymore
+        for key in sorted(previously_copied - self.needed[stage]):
+            prev = self.previous['files'].get(key)
+            if prev is not None:
+                self.remove_file(self.get_output_path(prev, stage), root)
+
+    def finalize(self) -> T.SystemChange:
+        ''' Records the state of all the files in the index and writes the manifest to disk '''
+        if not self.enabled:
+            return
+
+        for fo in set(self.pb.index.files.values()):
+            entry = self.current['files'].setdefault(fo.key, {})
+            entry.update(self.get_signature(fo))
+            if 'markdown' in fo.path.keys():
+                entry['md_path'] = fo.path['markdown']['file_relative_path'].as_posix()
+            if 'html' in fo.path.keys():
+                entry['html_path'] = fo.path['html']['file_relative_path'].as_posix()
+
+        self.current['file_keys'] = sorted(self.pb.index.files.keys())
+
+        self.folder.mkdir(parents=True, exist_ok=True)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(self.current, f)
+
+        s = self.stats
+        print(f"> INCREMENTAL BUILD: markdown: {s['ntm_reused']} reused, {s['ntm_converted']} converted; "
+              f"html: {s['mth_reused']} reused, {s['mth_converted']} converted, {s['html_unchanged']} files left untouched")
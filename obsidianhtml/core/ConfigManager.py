@@ -75,6 +75,10 @@ class Config:
         else:
             self.pb.verbose = self.config['toggles']['verbose_printout']
 
+        # (If --jobs is passed in, ConvertVault will set self.jobs)
+        if self.pb.jobs is not None:
+            self.config['jobs'] = self.pb.jobs
+
         # Set toggles/no_tabs
         layout = self.config['toggles']['features']['styling']['layout']
         if layout == 'tabs':
@@ -1,3 +1,40 @@
+class PathSuffixMap:
+    ''' Maps every tail of a path (e.g. "c.md", "b/c.md", "a/b/c.md" for "a/b/c.md") to the paths that end with it.
+        This gives the same result as GetMatches() without having to compare the link to every file in the index. '''
+    def __init__(self):
+        self.candidates = {}        # suffix --> rel paths, in the order they were added
+        self.paths = set()
+        self.unique_suffixes = {}   # rel path --> shortest suffix that no other path ends with (used for the node id)
+
+    def add(self, rel_path):
+        if rel_path in self.paths:
+            return
+        self.paths.add(rel_path)
+
+        # a path only loses its unique suffix when the new path ends with that same suffix
+        affected = [rel_path]
+        parts = rel_path.split('/')
+        for i in range(1, len(parts)+1):
+            paths = self.candidates.setdefault('/'.join(parts[-i:]), [])
+            if len(paths) == 1:
+                affected.append(paths[0])
+            paths.append(rel_path)
+
+        for path in affected:
+            self.unique_suffixes[path] = self.compile_unique_suffix(path)
+
+    def compile_unique_suffix(self, rel_path):
+        parts = rel_path.split('/')
+        for i in range(1, len(parts)+1):
+            suffix = '/'.join(parts[-i:])
+            if len(self.candidates[suffix]) == 1:
+                return suffix
+        # the path is the tail of another path (e.g. 'b/c.md' and 'a/b/c.md'), only the full path is unique
+        return rel_path
+
+    def get_matches(self, link):
+        return list(self.candidates.get(link, []))
+
 def GetObsidianFilePath(link, file_tree, pb):
     # a link can look like this: folder/note#chapter|alias
     # then link=folder/note, alias=alias, header=chapter
@@ -66,6 +103,11 @@ def FindFile(files, link, pb):
     if search and searchstring in olink:
         print(3, link)
 
+    # use the suffix map of the index when searching the index
+    path_suffixes = None
+    if files is pb.index.files:
+        path_suffixes = pb.index.path_suffixes
+
     def find(files, link):
         if search and searchstring in olink:
             print('f', link)
@@ -75,7 +117,7 @@ def FindFile(files, link, pb):
             return (link, files[link])
 
         # find all links that match the tail part
-        matches = GetMatches(files, link)
+        matches = GetMatches(files, link, path_suffixes)
 
         if search and searchstring in olink:
             print('m', matches)
@@ -115,7 +157,10 @@ def FindFile(files, link, pb):
     return result
 
 
-def GetMatches(files, link):
+def GetMatches(files, link, path_suffixes=None):
+    if path_suffixes is not None:
+        return path_suffixes.get_matches(link)
+
     search = False
     prevtrue = False
     # if 'Test Pages/textfile.txt' in link:
@@ -153,6 +198,10 @@ def GetNodeId(link, pb):
     if pb.gc('toggles/force_filename_to_lowercase', cached=True):
         link = link.lower()
 
+    # files in the index have their node id precomputed
+    if link in pb.index.path_suffixes.unique_suffixes:
+        return StripMdSuffix(pb.index.path_suffixes.unique_suffixes[link])
+
     node_id = ''
     parts = link.split('/')
     for i in range(1, len(parts)+1):
@@ -161,7 +210,7 @@ def GetNodeId(link, pb):
         else:
             node_id = f'{parts[-i]}/{node_id}'
 
-        matches = GetMatches(files, node_id)
+        matches = GetMatches(files, node_id, pb.index.path_suffixes)
         if len(matches) == 1:
             if node_id[-3:] == ".md":
                 node_id = node_id[:-3]
@@ -179,4 +228,32 @@ def GetNodeId(link, pb):
             node_id = node_id[:-3]
         return node_id
 
-    raise Exception(f'No unique node id found for {link}') 
+    node_id = StripMdSuffix(link)
+    print(f'\tWARNING: No unique node id found for {link}, it matches the files {matches}. Using "{node_id}" as node id, so links in the graph might be mixed up.')
+    return node_id
+
+def StripMdSuffix(node_id):
+    if node_id[-3:] == ".md":
+        return node_id[:-3]
+    return node_id
+
+def ReportNodeIdCollisions(pb):
+    ''' Different notes can end up with the same node id (e.g. "note.md" and a file called "note"). 
+        Prints a report of these cases, as the graph, backlinks etc. will mix these notes up. '''
+    node_ids = {}
+    for rel_path, suffix in pb.index.path_suffixes.unique_suffixes.items():
+        fo = pb.index.files[rel_path]
+        if not fo.metadata['is_note']:
+            continue
+        fos = node_ids.setdefault(StripMdSuffix(suffix), {})
+        fos.setdefault(fo, []).append(rel_path)
+
+    collisions = {node_id: fos for node_id, fos in node_ids.items() if len(fos) > 1}
+    if len(collisions) == 0:
+        return collisions
+
+    print('> WARNING: The following notes share the same node id, the graph/backlinks will not be able to tell them apart. Rename one of the files to fix this.')
+    for node_id, fos in collisions.items():
+        paths = ', '.join([paths[0] for paths in fos.values()])
+        print(f'\t- "{node_id}": {paths}')
+    return collisions
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import datetime
 import platform
-import os
+import sys
 import inspect
 import shutil               # used to remove a non-empty directory, copy files
 
@@ -11,6 +11,7 @@ from pathlib import Path
 from typing import Type
 
 from ..parser.MarkdownPage import MarkdownPage
+from ..parser.SectionIndex import SectionIndex, hash_text
 from ..lib import get_rel_html_url_prefix, get_html_url_prefix
 
 '''
@@ -33,25 +34,88 @@ we can compile all the relevant paths in one pass.
 The links have some complexity because we can configure to use absolute links or relative links.
 For simplicity's sake, we just compile both link types within the same function. There are some functions to automatically
 get the correct link based on the configurations.
+
+Very large vaults can have hundreds of thousands of files, so the paths are stored compactly: per output type only the
+path relative to the configured folder is kept (as an interned posix string), and the Path objects are created when they
+are asked for (see FilePath). fo.path['note']['file_absolute_path'] etc work the same as before.
 '''
 
-class FileObject:
-    pb = None                   # contains all config, paths, etc (global pass in config object)
-    path = None                 # hashtable with all relevant file paths
-    link = None                 # hashtable with all links
-    metadata = None             # information on the note, such as modified_date
-    md = None                   # MarkdownPage object
-    node = None                 # Node object, filled in, linked to network_tree
+class FilePath:
+    ''' The paths of a file for one output type (note, markdown or html), used like the dict it replaces:
+        path['folder_path'], path['file_absolute_path'], path['file_relative_path'], path['suffix'] '''
+    __slots__ = ('folder_path', 'rel_path_str')
+
+    def __init__(self, folder_path, rel_path):
+        self.folder_path = folder_path                          # Path() of the configured folder, shared by all files
+        self.rel_path_str = sys.intern(Path(rel_path).as_posix())     # path relative to folder_path, posix format
+
+    def __getitem__(self, key):
+        if key == 'file_absolute_path':
+            return self.folder_path.joinpath(self.rel_path_str)
+        if key == 'file_relative_path':
+            return Path(self.rel_path_str)
+        if key == 'folder_path':
+            return self.folder_path
+        if key == 'suffix':
+            return Path(self.rel_path_str).suffix[1:]
+        raise KeyError(key)
+
+
+class FilePaths:
+    ''' The FilePath per output type, used like the dict it replaces: fo.path['note'], 'html' in fo.path '''
+    __slots__ = ('note', 'markdown', 'html')
 
-    processed_ntm = False       # whether the note has already been processed in the note --> markdown flow
-    processed_mth = False       # whether the note has already been processed in the markdown --> html flow
+    def __init__(self):
+        self.note = None
+        self.markdown = None
+        self.html = None
+
+    def __getitem__(self, output):
+        file_path = getattr(self, output, None) if output in self.__slots__ else None
+        if file_path is None:
+            raise KeyError(output)
+        return file_path
+
+    def __setitem__(self, output, file_path):
+        setattr(self, output, file_path)
+
+    def __contains__(self, output):
+        return output in self.__slots__ and getattr(self, output) is not None
+
+    def keys(self):
+        return [x for x in self.__slots__ if getattr(self, x) is not None]
+
+
+class FileObject:
+    __slots__ = (
+        'pb',                   # contains all config, paths, etc (global pass in config object)
+        'path',                 # FilePaths with all relevant file paths
+        'link',                 # hashtable with all links
+        'metadata',             # information on the note, such as modified_date
+        'md',                   # MarkdownPage object, released once the note is converted (see release_markdown_page())
+        'node',                 # node of the note in network_tree (its name and metadata stay available after the MarkdownPage is released)
+        'key',                  # key under which this object is stored in pb.index.files
+        'converted_md',         # (fused pipeline) the converted note, handed from the note --> markdown flow to the markdown --> html flow
+        'section_index',        # SectionIndex of the headers and ^block-ids of the note, see get_section_index()
+        'oh_file_type',         # obs_to_md or md_to_html
+        'processed_ntm',        # whether the note has already been processed in the note --> markdown flow
+        'processed_mth',        # whether the note has already been processed in the markdown --> html flow
+    )
 
     def __init__(self, pb):
         self.pb = pb
 
-        self.path = {}
+        self.path = FilePaths()
         self.link = {}
         self.metadata = {}
+        self.md = None
+        self.node = None
+        self.key = None
+        self.converted_md = None
+        self.section_index = None
+        self.oh_file_type = None
+        self.processed_ntm = False
+        self.processed_mth = False
 
         # These values are not set under self.compile_metadata()
         # So the default values need to be set here.
@@ -61,17 +125,33 @@ class FileObject:
         self.md = MarkdownPage(self, input_type)
         return self.md
 
+    def release_markdown_page(self):
+        ''' Drops the MarkdownPage (and the contents of the note) once the note has been converted to html.
+            The steps after that use self.node for the name and metadata of the note. '''
+        if self.md is not None:
+            self.md.release()
+            self.md = None
+        self.section_index = None
+
+    def get_section_index(self, text):
+        ''' Returns the SectionIndex of the given text (the contents of this note), which is reused as long as the contents stay the same '''
+        text_hash = hash_text(text)
+        if self.section_index is None or self.section_index.hash != text_hash:
+            self.section_index = SectionIndex(text, text_hash)
+        return self.section_index
+
     def fullpath(self, output):
         return self.path[output]['file_absolute_path']
 
     def is_valid_note(self, output):
-        if self.fullpath(output).exists() == False:
-            return False
-        if self.fullpath(output).suffix != '.md':
+        # (fused pipeline) the markdown file might not have been written yet
+        if output == 'markdown' and self.converted_md is not None:
+            return True
+        if self.path[output]['suffix'] != 'md':
             return False
-        return True
+        return self.pb.index.file_exists(self.fullpath(output))
 
-    def init_note_path(self, source_file_absolute_path, compile_metadata=True):
+    def init_note_path(self, source_file_absolute_path, compile_metadata=True, stat_result=None):
         self.oh_file_type = 'obs_to_md'
 
         # Configured folders
@@ -79,34 +159,24 @@ class FileObject:
         target_folder_path = self.pb.paths['md_folder']
 
         # Note
-        self.path['note'] = {}
-        self.path['note']['folder_path'] = source_folder_path
-        self.path['note']['file_absolute_path'] = source_file_absolute_path
-        self.path['note']['file_relative_path'] = source_file_absolute_path.relative_to(source_folder_path)
-        self.path['note']['suffix'] = self.path['note']['file_absolute_path'].suffix[1:]
+        rel_path = source_file_absolute_path.relative_to(source_folder_path)
+        self.path['note'] = FilePath(source_folder_path, rel_path)
 
         # Markdown
-        self.path['markdown'] = {}
-        self.path['markdown']['folder_path'] = target_folder_path
-
-        if self.path['note']['file_relative_path'] == self.pb.paths['rel_obsidian_entrypoint']:
+        if rel_path == self.pb.paths['rel_obsidian_entrypoint']:
             # rewrite path to index.md if the note is configured as the entrypoint.
             self.metadata['is_entrypoint'] = True
-            self.path['markdown']['file_absolute_path'] = target_folder_path.joinpath('index.md')
-            self.path['markdown']['file_relative_path'] = self.path['markdown']['file_absolute_path'].relative_to(target_folder_path)
+            self.path['markdown'] = FilePath(target_folder_path, 'index.md')
 
             # also add self to pb.index.files under the key 'index.md' so it is findable
-            self.pb.index.files['index.md'] = self
+            self.pb.index.add_file_path('index.md', self)
         else:
-            self.path['markdown']['file_absolute_path'] = target_folder_path.joinpath(self.path['note']['file_relative_path'])
-            self.path['markdown']['file_relative_path'] = self.path['note']['file_relative_path']
-
-        self.path['markdown']['suffix'] = self.path['markdown']['file_absolute_path'].suffix[1:]
+            self.path['markdown'] = FilePath(target_folder_path, rel_path)
 
         # Metadata
-        self.metadata['depth'] = self._get_depth(self.path['note']['file_relative_path'])
+        self.metadata['depth'] = self._get_depth(self.path['note'].rel_path_str)
         if compile_metadata:
-            self.compile_metadata(source_file_absolute_path)            # is_note, creation_time, modified_time, is_video, is_audio, is_includable
+            self.compile_metadata(source_file_absolute_path, stat_result=stat_result)     # is_note, creation_time, modified_time, is_video, is_audio, is_includable
 
     def init_markdown_path(self, source_file_absolute_path=None):
         self.oh_file_type = 'md_to_html'
@@ -115,47 +185,34 @@ class FileObject:
         target_folder_path = self.pb.paths['html_output_folder']
 
         # compile the path['markdown'] section, or reuse the section from the previous step
-        if source_file_absolute_path is None:
-            source_file_absolute_path = self.path['markdown']['file_absolute_path']
-        else:
-            self.path['markdown'] = {}
-            self.path['markdown']['folder_path'] = source_folder_path
-            self.path['markdown']['file_absolute_path'] = source_file_absolute_path
-            self.path['markdown']['file_relative_path'] = source_file_absolute_path.relative_to(source_folder_path)
-            self.path['markdown']['suffix'] = source_file_absolute_path.suffix[1:]
+        if source_file_absolute_path is not None:
+            self.path['markdown'] = FilePath(source_folder_path, source_file_absolute_path.relative_to(source_folder_path))
 
         # html
-        self.path['html'] = {}
-        self.path['html']['folder_path'] = target_folder_path
-
         if self.path['markdown']['file_relative_path'] == self.pb.paths['rel_md_entrypoint_path']:
             # rewrite path to index.html if the markdown note is configured as the entrypoint.
             self.metadata['is_entrypoint'] = True
-            self.path['html']['file_absolute_path'] = target_folder_path.joinpath('index.html')
-            self.path['html']['file_relative_path'] = self.path['html']['file_absolute_path'].relative_to(target_folder_path)
+            self.path['html'] = FilePath(target_folder_path, 'index.html')
         else:
             # rewrite markdown suffix to html suffix
-            target_rel_path_posix = self.path['markdown']['file_relative_path'].as_posix()
+            target_rel_path_posix = self.path['markdown'].rel_path_str
             if target_rel_path_posix[-3:] == '.md':
-                target_rel_path = Path(target_rel_path_posix[:-3] + '.html')
-            else:
-                target_rel_path = Path(target_rel_path_posix)
+                target_rel_path_posix = target_rel_path_posix[:-3] + '.html'
 
-            self.path['html']['file_absolute_path'] = target_folder_path.joinpath(target_rel_path)
-            self.path['html']['file_relative_path'] = target_rel_path
-            self.path['html']['suffix'] = self.path['html']['file_absolute_path'].suffix[1:]
+            self.path['html'] = FilePath(target_folder_path, target_rel_path_posix)
 
         # Metadata
         # call to self.compile_metadata() should be done manually in the calling function
-        self.metadata['depth'] = self._get_depth(self.path['html']['file_relative_path'])
+        self.metadata['depth'] = self._get_depth(self.path['html'].rel_path_str)
 
-    def compile_metadata(self, path, cached=False):
+    def compile_metadata(self, path, cached=False, stat_result=None):
+        ''' stat_result can be passed in when the file was already stat'ed (e.g. while scanning the vault), so that it isn't stat'ed again '''
         if cached and 'is_note' in self.metadata:
             return
-        self.set_times(path)
-        self.set_file_types(path)
+        self.set_times(path, stat_result)
+        self.set_file_types(path, stat_result)
 
-    def set_file_types(self, path):
+    def set_file_types(self, path, stat_result=None):
         self.metadata['is_note'] = False
         self.metadata['is_video'] = False
         self.metadata['is_audio'] = False
@@ -176,49 +233,66 @@ class FileObject:
         if suffix in self.pb.gc('embeddable_file_suffixes', cached=True):
             self.metadata['is_embeddable'] = True
 
-        if path.exists() and self.metadata['is_note']:
+        if self.metadata['is_note'] and (stat_result is not None or self.pb.index.file_exists(path)):
             self.metadata['is_parsable_note'] = True
 
-    def set_times(self, path):
+    def set_times(self, path, stat_result=None):
+        if stat_result is None:
+            stat_result = self.pb.index.stat(path)
         if platform.system() == 'Windows' or platform.system() == 'Darwin':
-            self.metadata['creation_time'] = datetime.datetime.fromtimestamp(os.path.getctime(path)).isoformat()
-            self.metadata['modified_time'] = datetime.datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+            self.metadata['creation_time'] = datetime.datetime.fromtimestamp(stat_result.st_ctime).isoformat()
+            self.metadata['modified_time'] = datetime.datetime.fromtimestamp(stat_result.st_mtime).isoformat()
         else:
-            self.metadata['modified_time'] = datetime.datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+            self.metadata['modified_time'] = datetime.datetime.fromtimestamp(stat_result.st_mtime).isoformat()
 
     def get_depth(self, mode):
-        return self._get_depth(self.path[mode]['file_relative_path'])
-    def _get_depth(self, rel_path):
-        return rel_path.as_posix().count('/')
+        return self._get_depth(self.path[mode].rel_path_str)
+    def _get_depth(self, rel_path_str):
+        return rel_path_str.count('/')
 
     def get_link(self, link_type, origin:'FileObject'=None, origin_rel_dst_path_str=None):
         # Get origin_rel_dst_path_str
         if origin_rel_dst_path_str is None:
             if origin is not None:
-                origin_rel_dst_path_str = origin.path[link_type]['file_relative_path'].as_posix()
+                origin_rel_dst_path_str = origin.path[link_type].rel_path_str
             else:
-                origin_rel_dst_path_str = self.path[link_type]['file_relative_path'].as_posix()
+                origin_rel_dst_path_str = self.path[link_type].rel_path_str
 
-        # recompile links for the given origin_path and return correct link (absolute or relative)
+        # compile links for the given origin_path and return correct link (absolute or relative)
         if link_type == 'markdown':
-            self.compile_markdown_link(origin_rel_dst_path_str)
+            self.get_compiled_links(link_type, origin_rel_dst_path_str)
 
             if self.pb.gc('toggles/relative_path_md', cached=True):
                 return self.link[link_type]['relative']
 
         elif link_type == 'html':
-            self.compile_html_link(origin_rel_dst_path_str)
+            self.get_compiled_links(link_type, origin_rel_dst_path_str)
 
             if self.pb.gc('toggles/relative_path_html', cached=True):
                 return self.link[link_type]['relative']
 
         return self.link[link_type]['absolute']
 
+    def get_compiled_links(self, link_type, origin_rel_dst_path_str):
+        ''' The relative link only depends on the depth of the origin, so the links are compiled once per depth and kept in pb.link_cache.
+            The cache is cleared when the html_url_prefix changes (see PicknickBasket.sc()). '''
+        key = (self, link_type, origin_rel_dst_path_str.count('/'))
+        links = self.pb.link_cache.get(key)
+        if links is None:
+            if link_type == 'markdown':
+                self.compile_markdown_link(origin_rel_dst_path_str)
+            else:
+                self.compile_html_link(origin_rel_dst_path_str)
+            links = self.link[link_type]
+            self.pb.link_cache[key] = links
+        self.link[link_type] = links
+        return links
+
     def compile_markdown_link(self, origin_rel_dst_path_str):
         self.link['markdown'] = {}
 
         # Absolute
-        web_abs_path = self.path['markdown']['file_relative_path'].as_posix()
+        web_abs_path = self.path['markdown'].rel_path_str
         self.link['markdown']['absolute'] = '/'+web_abs_path
 
         # Relative
@@ -230,12 +304,12 @@ class FileObject:
 
         # Absolute
         html_url_prefix = self.pb.gc('html_url_prefix')
-        abs_link = self.path['html']['file_relative_path'].as_posix()
+        abs_link = self.path['html'].rel_path_str
         self.link['html']['absolute'] = html_url_prefix+'/'+abs_link
 
         # Relative
         prefix = get_rel_html_url_prefix(origin_rel_dst_path_str)
-        self.link['html']['relative'] = prefix+'/'+self.path['html']['file_relative_path'].as_posix()
+        self.link['html']['relative'] = prefix+'/'+abs_link
 
     def copy_file(self, mode):
         if mode == 'ntm':
@@ -250,4 +324,8 @@ class FileObject:
 
         dst_file_path.parent.mkdir(parents=True, exist_ok=True)
         shutil.copyfile(src_file_path, dst_file_path)
+        self.pb.index.register_written_file(dst_file_path)
+
+        if self.pb.manifest is not None:
+            self.pb.manifest.add_copy(self, mode)
 
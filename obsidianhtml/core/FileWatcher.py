@@ -0,0 +1,180 @@
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+
+from pathlib import Path
+
+'''
+Watches a folder (recursively) for changes, used by the watch command.
+
+On Linux inotify is used, so that changes are picked up as soon as they happen without having to walk the folder.
+When inotify is not available (other platforms, or the inotify watch limit is reached), the watcher falls back to
+polling the mtime and size of every file in the folder.
+
+Editors tend to save a file in multiple steps (write to a temporary file, rename, touch...), so changes are
+collected until no new changes come in for `debounce` seconds.
+'''
+
+# inotify constants, see `man inotify`
+IN_MODIFY       = 0x00000002
+IN_ATTRIB       = 0x00000004
+IN_CLOSE_WRITE  = 0x00000008
+IN_MOVED_FROM   = 0x00000040
+IN_MOVED_TO     = 0x00000080
+IN_CREATE       = 0x00000100
+IN_DELETE       = 0x00000200
+IN_DELETE_SELF  = 0x00000400
+IN_MOVE_SELF    = 0x00000800
+IN_Q_OVERFLOW   = 0x00004000
+IN_IGNORED      = 0x00008000
+IN_ISDIR        = 0x40000000
+IN_WATCH_MASK   = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT_HEADER = struct.Struct('iIII')    # wd, mask, cookie, len
+
+
+class FileWatcher:
+    root = None
+    ignore = None           # function that returns True for paths that should not be watched
+    method = None           # 'inotify' or 'polling'
+
+    def __init__(self, root, ignore=None, interval=0.5, use_inotify=True):
+        self.root = Path(root).resolve()
+        self.ignore = ignore if ignore is not None else (lambda path: False)
+        self.interval = interval
+
+        self.method = 'polling'
+        if use_inotify and sys.platform.startswith('linux'):
+            try:
+                self.init_inotify()
+                self.method = 'inotify'
+            except OSError as e:
+                print(f'\tWARNING: Could not use inotify to watch {self.root} ({e}), falling back to polling every {interval}s')
+
+        if self.method == 'polling':
+            self.snapshot = self.take_snapshot()
+
+    def wait_for_changes(self, debounce=0.2):
+        ''' Blocks until something changes in the watched folder, and returns the set of changed paths (files and folders) '''
+        if self.method == 'inotify':
+            return self.wait_for_changes_inotify(debounce)
+        return self.wait_for_changes_polling(debounce)
+
+    # Inotify
+    # ---------------------------------------------------------
+    def init_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not supported by the c library')
+
+        self.libc = libc
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+        self.watches = {}       # watch descriptor --> folder path
+        self.add_watches(self.root)
+
+    def add_watches(self, folder):
+        ''' Watches the folder and all its subfolders. Returns the files that were found in them. '''
+        found = []
+        for dirpath, dirnames, filenames in os.walk(folder):
+            dirpath = Path(dirpath)
+            dirnames[:] = [x for x in dirnames if not self.ignore(dirpath.joinpath(x))]
+
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), IN_WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, f'{os.strerror(errno)} (watching {dirpath})')
+            self.watches[wd] = dirpath
+            found += [dirpath.joinpath(x) for x in filenames]
+        return found
+
+    def read_events(self, timeout):
+        ''' Returns the paths that changed, or None when nothing happened within timeout seconds.
+            The set is empty when all the events were for ignored paths. '''
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return None
+
+        changed = set()
+        data = os.read(self.fd, 64 * 1024)
+        pos = 0
+        while pos < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = os.fsdecode(data[pos:pos+length].rstrip(b'\0'))
+            pos += length
+
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped, we don't know what changed
+                changed.add(self.root)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches:
+                continue
+
+            path = self.watches[wd].joinpath(name) if name else self.watches[wd]
+            if self.ignore(path):
+                continue
+            changed.add(path)
+
+            # new folders have to be watched as well, files might already have been written to it before the watch was added
+            if (mask & IN_ISDIR) and (mask & (IN_CREATE | IN_MOVED_TO)) and path.is_dir():
+                changed.update([x for x in self.add_watches(path) if not self.ignore(x)])
+
+        return changed
+
+    def wait_for_changes_inotify(self, debounce):
+        # changes to ignored paths (e.g. an output folder inside the vault) should not wake us up
+        changed = set()
+        while len(changed) == 0:
+            changed = self.read_events(timeout=None)
+        while True:
+            more = self.read_events(timeout=debounce)
+            if more is None:
+                return changed
+            changed.update(more)
+
+    # Polling
+    # ---------------------------------------------------------
+    def take_snapshot(self):
+        snapshot = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirpath = Path(dirpath)
+            dirnames[:] = [x for x in dirnames if not self.ignore(dirpath.joinpath(x))]
+            for name in filenames:
+                path = dirpath.joinpath(name)
+                if self.ignore(path):
+                    continue
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def poll(self):
+        snapshot = self.take_snapshot()
+        changed = set([x for x in snapshot.keys() if self.snapshot.get(x) != snapshot[x]])
+        changed.update([x for x in self.snapshot.keys() if x not in snapshot])
+        self.snapshot = snapshot
+        return changed
+
+    def wait_for_changes_polling(self, debounce):
+        changed = set()
+        while len(changed) == 0:
+            time.sleep(self.interval)
+            changed = self.poll()
+        while True:
+            time.sleep(debounce)
+            more = self.poll()
+            if len(more) == 0:
+                return changed
+            changed.update(more)
@@ -1,15 +1,18 @@
 
 
 import yaml
-import glob
 import os
 from time import sleep
 
-from ..lib import pushd, WriteFileLog
+from ..lib import WriteFileLog, PathMatcher
 
 from .NetworkTree import NetworkTree
 from .FileObject import FileObject
+from .FileFinder import PathSuffixMap, ReportNodeIdCollisions
+from ..parser.MarkdownPage import parse_frontmatter
 
+# stat_cache value of the files that this build wrote (they exist, but their stat result is not known)
+FILE_WRITTEN = 'written'
 
 class Index:
     def __init__(self, pb):
@@ -20,6 +23,13 @@ class Index:
         # setup network tree, which keeps track of the graph (nodes and the links between them)
         self.network_tree = NetworkTree(self)
 
+        # notes that were parsed in this build, see parse_note()
+        self.parsed_notes = {}
+
+        # stat results of the files that were found while scanning, and the files that this build wrote, see stat()
+        self.stat_cache = {}
+        self.stat_calls_avoided = 0
+
         # setup the file tree, which provides detailed information on the files in the vault/output folders
         self.init_file_tree()
         self.import_files_into_file_tree()
@@ -27,7 +37,8 @@ class Index:
     def init_file_tree(self):
         ''' This method sets up everything needed for the file tree. It does not yet load the files into the file tree '''
         self.files = {}
-        self.excluded_folders = []
+        self.path_suffixes = PathSuffixMap()     # used by FindFile() to find files by the tail of their path
+        self.exclude_matcher = None             # PathMatcher of the exclude_glob patterns
         self.included_folders = []
         self.input_folder_root = ''
 
@@ -52,13 +63,20 @@ class Index:
 
         # Load files into pb.index.files
         for input_dir in self.included_folders:
-            for path in input_dir.rglob('*'):
-                self.convert_file_to_file_object_and_add_to_file_tree(path, root, self.excluded_folders, pb)
+            for path, stat_result in self.scan_folder(input_dir):
+                if stat_result is not None:
+                    self.stat_cache[os.fspath(path)] = stat_result
+                self.convert_file_to_file_object_and_add_to_file_tree(path, root, pb, stat_result)
 
         # add index.md when converting straight from md to html
         if not pb.gc('toggles/compile_md', cached=True):
-            print(root.joinpath('index.md'))
-            self.convert_file_to_file_object_and_add_to_file_tree(root.joinpath('index.md'), root, self.excluded_folders, pb)
+            path = root.joinpath('index.md')
+            print(path)
+            if not self.exclude_matcher.match('index.md'):
+                self.convert_file_to_file_object_and_add_to_file_tree(path, root, pb)
+
+        # Node ids are precomputed while adding the files, report the notes that can't be told apart
+        ReportNodeIdCollisions(pb)
 
         # Done
         if pb.gc('toggles/verbose_printout', cached=True):
@@ -67,31 +85,58 @@ class Index:
         if pb.gc('toggles/extended_logging', cached=True):
             WriteFileLog(pb.index.files, pb.paths['log_output_folder'].joinpath('files.md'), include_processed=False)
 
-    def convert_file_to_file_object_and_add_to_file_tree(self, path, root, excluded_folders, pb):
-        if path.is_dir():
+    def scan_folder(self, folder):
+        ''' Yields (path, stat result) for every file in the folder and its subfolders, in the same order as folder.rglob('*') would. 
+            Excluded folders are skipped as a whole, instead of file by file. Symlinks to folders are not followed. '''
+        rel_path = folder.relative_to(self.input_folder_root).as_posix()
+        if rel_path == '.':
+            rel_path = ''
+        elif self.exclude_matcher.match(rel_path, is_dir=True):
             return
-
-        # Exclude configured subfolders
-        try:
-            _continue = False
-            for folder in excluded_folders:
-                if path.resolve().is_relative_to(folder):
-                    if pb.gc('toggles/verbose_printout', cached=True):
-                        print(f'\tExcluded folder {folder}: Excluded file {path.name}.')
-                    _continue = True
-                    break
-            if _continue:
-                return
-        except:
-            None
-
+        yield from self._scan_folder(folder, rel_path)
+
+    def _scan_folder(self, folder, rel_folder):
+        with os.scandir(folder) as it:
+            entries = list(it)
+
+        subfolders = []
+        for entry in entries:
+            path = folder.joinpath(entry.name)
+            rel_path = rel_folder + '/' + entry.name if rel_folder else entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+
+            # Exclude configured subfolders and files
+            # The parent folders are not excluded (or we would not be here), so only the path itself has to be checked
+            if self.exclude_matcher.match(rel_path, is_dir=is_dir):
+                if self.pb.gc('toggles/verbose_printout', cached=True):
+                    print(f'\tExcluded {"folder" if is_dir else "file"} {rel_path}')
+                continue
+
+            if is_dir:
+                if not entry.is_symlink():
+                    subfolders.append((path, rel_path))
+                continue
+
+            try:
+                stat_result = entry.stat()
+            except OSError:
+                stat_result = None
+            yield path, stat_result
+
+        for path, rel_path in subfolders:
+            yield from self._scan_folder(path, rel_path)
+
+    def convert_file_to_file_object_and_add_to_file_tree(self, path, root, pb, stat_result=None):
         # Create object to help with handling all the info on the file
         fo = FileObject(pb)
 
         # Compile paths
         if pb.gc('toggles/compile_md', cached=True):
             # compile note --> markdown
-            fo.init_note_path(path)
+            fo.init_note_path(path, stat_result=stat_result)
             fo.compile_metadata(fo.path['note']['file_absolute_path'], cached=True)
 
             if pb.gc('toggles/compile_html', cached=True):
@@ -104,7 +149,7 @@ class Index:
         else:
             # compile markdown --> html (based on the found markdown path)
             fo.init_markdown_path(path)
-            fo.compile_metadata(fo.path['markdown']['file_absolute_path'], cached=True)
+            fo.compile_metadata(fo.path['markdown']['file_absolute_path'], cached=True, stat_result=stat_result)
 
             # Add to tree
             self.add_file_object_to_file_tree(fo.path['markdown']['file_relative_path'].as_posix(), fo)
@@ -112,7 +157,55 @@ class Index:
     def add_file_object_to_file_tree(self, rel_path, obj):
         if self.pb.gc('toggles/force_filename_to_lowercase', cached=True):
             rel_path = rel_path.lower()
+        obj.key = rel_path
+        self.add_file_path(rel_path, obj)
+
+    def add_file_path(self, rel_path, obj):
+        ''' Makes the file object findable under rel_path. Always use this instead of setting self.files[rel_path] directly. '''
         self.files[rel_path] = obj
+        self.path_suffixes.add(rel_path)
+
+    def stat(self, path):
+        ''' Same as os.stat(), but the stat results of the files that were found while scanning the vault are reused (as are the results of earlier calls) '''
+        key = os.fspath(path)
+        stat_result = self.stat_cache.get(key)
+        if stat_result is not None and stat_result is not FILE_WRITTEN:
+            self.stat_calls_avoided += 1
+            return stat_result
+        stat_result = os.stat(key)
+        self.stat_cache[key] = stat_result
+        return stat_result
+
+    def file_exists(self, path):
+        ''' Same as path.exists(), without a stat call for the files that were found while scanning the vault or that were written by this build '''
+        if os.fspath(path) in self.stat_cache:
+            self.stat_calls_avoided += 1
+            return True
+        try:
+            self.stat(path)
+        except OSError:
+            return False
+        return True
+
+    def register_written_file(self, path):
+        ''' Should be called for every file that this build writes, so that file_exists() knows about it '''
+        self.stat_cache[os.fspath(path)] = FILE_WRITTEN
+
+    def forget_file(self, path):
+        ''' Should be called for every file that this build removes '''
+        self.stat_cache.pop(os.fspath(path), None)
+
+    def parse_note(self, path):
+        ''' Returns the frontmatter metadata and the content of the note. A note is only parsed again when its mtime or size changes.
+            The metadata is shared between all callers, so make a copy before changing it. '''
+        st = os.stat(path)
+        entry = self.parsed_notes.get(path)
+        if entry is None or entry[0] != st.st_mtime_ns or entry[1] != st.st_size:
+            with open(path, encoding="utf-8") as f:
+                metadata, page = parse_frontmatter(f.read())
+            entry = (st.st_mtime_ns, st.st_size, metadata, page)
+            self.parsed_notes[path] = entry
+        return entry[2], entry[3]
 
     def set_input_folder_root(self):
         if self.pb.gc('toggles/compile_md', cached=True):
@@ -121,30 +214,14 @@ class Index:
             self.input_folder_root = self.pb.paths['md_folder']
 
     def compile_excluded_folder_list(self):
-        ''' This function converts the glob patterns to a simple list of folders to exclude '''
+        ''' This function compiles the glob patterns of the files and folders to exclude '''
 
         # Test input
         exclude_subfolders = self.pb.gc('exclude_glob')
         if not isinstance(exclude_subfolders, list):
             raise Exception(f"Type of exclude_subfolders should be list, got {type(exclude_subfolders)}")
 
-        # move working dir to root dir (needed for glob to work)
-        owd = pushd(self.input_folder_root)
-
-        # find all excluded folders
-        excluded_folders = []
-        for line in exclude_subfolders:
-            if line[0] != '/':
-                line = '**/' + line
-            else:
-                line = line[1:]
-            excluded_folders += [self.input_folder_root.joinpath(x) for x in glob.glob(line, recursive=True)]
-
-        # remove duplicate and store result
-        self.excluded_folders = list(set(excluded_folders))
-
-        # back to original working directory
-        os.chdir(owd)
+        self.exclude_matcher = PathMatcher(exclude_subfolders)
 
     def compile_included_folder_list(self):
         ''' Compile given rtr paths to absolute posix string paths, and test if they exist. If no input folders given, just list the root itself '''
@@ -18,8 +18,15 @@ class NetworkTree:
         self.index = index
         self.pb = index.pb
 
+        # the lists in self.tree are only kept for the output (graph.json), use the lookups below to find nodes/links
         self.tree = {'nodes': [], 'links': []}
-        self.node_lookup = {}
+        self.node_lookup = {}       # node id --> node, kept up to date by add_node()
+        self.link_keys = set()      # (source, target) of every link in the tree, kept up to date by AddLink()
+
+        # adjacency indexes, kept up to date by AddLink()
+        self.outbound = {}          # node id --> links that have this node as source
+        self.inbound = {}           # node id --> links that have this node as target
+        self.neighbours = {}        # node id --> ids of the nodes that it links to / is linked from, in the order the links were added
 
         self.node_graph = None
         self.node_graph_lookup = None
@@ -54,6 +61,7 @@ class NetworkTree:
         node['url'] = pb.gc("html_url_prefix") + '/' + rel_dst_path.as_posix()
         node['rtr_url'] = rel_dst_path.as_posix()
         pb.index.network_tree.add_node(node)
+        fo.node = node
 
         # Backlinks are set so when recursing, the links (edges) can be determined
         if backlink_node is not None:
@@ -72,18 +80,19 @@ class NetworkTree:
         if self.pb.verbose:
             print("Received node", node_obj)
         # Skip if already present
-        for node in self.tree['nodes']:
-            if node['id'] == node_obj['id']:
-                node['metadata'] = node_obj['metadata'].copy()
-                if self.pb.verbose:
-                    print("Node already present")
-                return
+        node = self.node_lookup.get(node_obj['id'])
+        if node is not None:
+            node['metadata'] = node_obj['metadata'].copy()
+            if self.pb.verbose:
+                print("Node already present")
+            return
         
         # Add node
         self.nid_inc += 1
         node_obj['nid'] = self.nid_inc
 
         self.tree['nodes'].append(node_obj)
+        self.node_lookup[node_obj['id']] = node_obj
         if self.pb.verbose:
             print("Node added")
 
@@ -91,14 +100,19 @@ class NetworkTree:
         if self.pb.verbose:
             print("Received link", link_obj)
         # Skip if already present        
-        for link in self.tree['links']:
-            if link['source'] == link_obj['source'] and link['target'] == link_obj['target']:
-                if self.pb.verbose:
-                    print("Link already present")
-                return
+        link_key = (link_obj['source'], link_obj['target'])
+        if link_key in self.link_keys:
+            if self.pb.verbose:
+                print("Link already present")
+            return
 
         # Add link
         self.tree['links'].append(link_obj) 
+        self.link_keys.add(link_key)
+        self.outbound.setdefault(link_obj['source'], []).append(link_obj)
+        self.inbound.setdefault(link_obj['target'], []).append(link_obj)
+        self.neighbours.setdefault(link_obj['source'], []).append(link_obj['target'])
+        self.neighbours.setdefault(link_obj['target'], []).append(link_obj['source'])
         if self.pb.verbose:
             print("Link added")
 
@@ -111,22 +125,21 @@ class NetworkTree:
     # METHODS
     # ===============================================================================================
     def compile_node_lookup(self):
+        # (add_node() already keeps the lookup up to date, this is a safeguard for nodes that were added to self.tree directly)
         for n in self.tree['nodes']:
             self.node_lookup[n['id']] = n
     
-    def AddCrosslinks(self):
-        for link in self.tree['links']:
-            src = self.node_lookup[link['source']]
-            dst = self.node_lookup[link['target']]
-
-            src['links'].append(dst['id'])
-            src['outward_links'].append(dst['id'])
-            dst['links'].append(src['id'])
-            dst['inward_links'].append(src['id'])
+    def get_backlinks(self, node_id):
+        ''' Returns the links that have the given node as target '''
+        return self.inbound.get(node_id, [])
 
-        # remove duplicates from links
+    def AddCrosslinks(self):
         for node in self.tree['nodes']:
-            node['links'] = list(dict.fromkeys(node['links']))
+            node['outward_links'] += [link['target'] for link in self.outbound.get(node['id'], [])]
+            node['inward_links'] += [link['source'] for link in self.inbound.get(node['id'], [])]
+
+            # remove duplicates from links
+            node['links'] = list(dict.fromkeys(node['links'] + self.neighbours.get(node['id'], [])))
 
     def CompileNoteGraphDataStructure(self):
         d = {'id': '', 'title': '', 'linkTo': None, 'referencedBy': None}
@@ -142,13 +155,10 @@ class NetworkTree:
             note_graph.append(di)
             note_lookup[node['id']] = di
         
-        for link in self.tree['links']:
-            src = note_lookup[link['source']]
-            dst = note_lookup[link['target']]
-            if src['id'] not in dst['referencedBy']:
-                dst['referencedBy'].append(src['id'])
-            if dst['id'] not in src['linkTo']:
-                src['linkTo'].append(dst['id'])
+        for node in self.tree['nodes']:
+            di = note_lookup[node['id']]
+            di['linkTo'] = list(dict.fromkeys([note_lookup[link['target']]['id'] for link in self.outbound.get(node['id'], [])]))
+            di['referencedBy'] = list(dict.fromkeys([note_lookup[link['source']]['id'] for link in self.inbound.get(node['id'], [])]))
 
         self.node_graph = note_graph
         self.node_graph_lookup = note_lookup
@@ -10,6 +10,7 @@ class PicknickBasket:
     state = None                    # used for debugging info, keeps track of what we are doing at each point in time
     config = None                   # dict with all the config values
     verbose = None
+    jobs = None                     # number of processes to render html with, set with --jobs
     index = None                    # contains the file tree and the network tree
     tagtree = None
     paths = None                    # paths to input and output folders, as configured by user
@@ -18,10 +19,19 @@ class PicknickBasket:
     gzip_hash = ''
     treeobj = None
     jars = None                     # dict with contents to store for later, see it as a cache
+    manifest = None                 # BuildManifest, keeps track of the previous build for incremental builds
+    render_queue = None             # pages that are waiting to be rendered, when rendering with multiple processes
+    markdown_writer = None          # writes the markdown notes in the background, when using the fused pipeline
+    markdown_writes = None          # futures of the writes above
+    deferred_html = None            # DeferredHtml, keeps the first-pass html of the pages until the second pass writes them
+    markdown_engine = None          # markdown.Markdown instance that is reused for every note, see get_markdown_engine()
+    transclusion_cache = None       # TransclusionCache, keeps the included notes (![[note]]) that were already converted in this build
+    link_cache = None               # links compiled by FileObject.get_link(), keyed by (file object, link type, depth of the origin)
 
     def __init__(self):
         self.tagtree = {'notes': [], 'subtags': {}}
         self.jars = {}
+        self.link_cache = {}
         # self.network_tree = NetworkTree(self.verbose)
         self.search = SearchHead()
 
@@ -72,6 +82,9 @@ class PicknickBasket:
         if pb.gc('toggles/extended_logging', cached=True):
             paths['log_output_folder'] = Path(pb.gc('log_output_folder_path_str')).resolve()
 
+        if pb.gc('toggles/incremental_build', cached=True):
+            paths['build_cache_folder'] = Path(pb.gc('build_cache_folder_path_str')).resolve()
+
         # Deduce relative paths
         if pb.gc('toggles/compile_md', cached=True):
             paths['rel_obsidian_entrypoint'] = paths['obsidian_entrypoint'].relative_to(paths['obsidian_folder'])
@@ -114,6 +127,9 @@ class PicknickBasket:
         return self.config.get_config(path)
 
     def sc(self, path, value):
+        if path == 'html_url_prefix' and value != self.gc('html_url_prefix'):
+            # the absolute html links start with the html_url_prefix
+            self.link_cache.clear()
         return self.config.set_config(path, value)
 
     def EnsureTreeObj(self):
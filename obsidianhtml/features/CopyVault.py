@@ -1,13 +1,12 @@
 import os
 import shutil
-import glob
 import tempfile             # used to create temporary files/folders
 
 from subprocess import Popen, PIPE
 from pathlib import Path
 
 from ..core import Types as T
-from ..lib import is_installed, pushd, should_ignore
+from ..lib import is_installed, PathMatcher
 
 
 def CreateTemporaryCopy(source_folder_path, pb):
@@ -43,25 +42,53 @@ def CreateTemporaryCopy(source_folder_path, pb):
     elif copy_method not in ['shutil', 'shutil_walk']:
         raise Exception(f"Copy method of {copy_method} not known.")
     else:
-        # Compile ignore list
-        excluded_paths = []
+        # Compile ignore function
+        ignore = None
         if isinstance(pb.gc('exclude_glob', cached=True), list):
-            owd = pushd(source_folder_path)          # move working dir to root dir (needed for glob)
-            for line in pb.gc('exclude_glob', cached=True):
-                excluded_paths += glob.glob(line, recursive=True)
-            excluded_paths = [Path(x) for x in excluded_paths]
-            print('Paths that will be ignored:', [x.as_posix() for x in excluded_paths])
-            os.chdir(owd)
+            matcher = PathMatcher(pb.gc('exclude_glob', cached=True))
+            ignore = lambda path: matcher.match_path(path, source_folder_path)
+            print('Patterns that will be ignored:', matcher.patterns)
 
         # Call copytree function (shutil_walk or shutil)
         if pb.gc('copy_vault_to_tempdir_method') == 'shutil_walk':
-            copytree_shutil_walk(source_folder_path, tmpdir.name, ignore=excluded_paths, pb=pb)
+            copytree_shutil_walk(source_folder_path, tmpdir.name, ignore=ignore, pb=pb)
         else:
-            copytree_shutil(source_folder_path, tmpdir.name, ignore=excluded_paths, pb=pb)
+            copytree_shutil(source_folder_path, tmpdir.name, ignore=ignore, pb=pb)
 
     print("< COPYING VAULT: Done")
     return tmpdir
 
+def SyncTemporaryCopy(source_folder_path, tmpdir, changed_paths, ignore, pb):
+    ''' Brings the temporary copy of the vault up to date by copying over/removing only the given paths (used by the watch command).
+        ignore(path) returns True for the paths that should not be copied.
+        Returns the temporary copy, which is a new one when the whole vault had to be copied again. '''
+    # The watcher reports the root folder when it does not know what changed (e.g. when its event queue overflowed).
+    # Copying the root folder over the copy would not remove the files that were deleted, so start over with a new copy.
+    if Path(source_folder_path).resolve() in changed_paths:
+        new_tmpdir = CreateTemporaryCopy(Path(source_folder_path), pb)
+        tmpdir.cleanup()
+        return new_tmpdir
+
+    dst_root = Path(tmpdir.name).resolve()
+
+    for path in sorted(changed_paths):
+        dst_path = dst_root.joinpath(path.relative_to(source_folder_path))
+
+        if pb.gc('copy_vault_to_tempdir_follow_copy'):
+            print('sync: ', path.as_posix())
+
+        if path.is_dir():
+            copytree_shutil(path, dst_path, ignore=ignore, pb=pb)
+        elif path.exists():
+            dst_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy(path, dst_path)
+        elif dst_path.is_dir():
+            shutil.rmtree(dst_path)
+        elif dst_path.exists():
+            dst_path.unlink()
+
+    return tmpdir
+
 def copy_tree_rsync(src_dir, dst_dir, exclude, verbose=False):
     # Get relative ignore paths
     exclude_list = []
@@ -109,7 +136,7 @@ def copytree_shutil(src, dst, symlinks=False, ignore=None, copy_function=shutil.
         srcname = os.path.join(src, name)
         dstname = os.path.join(dst, name)
 
-        if should_ignore(ignore, Path(srcname)):
+        if ignore is not None and ignore(Path(srcname)):
             continue
 
         if follow_copy:
@@ -156,14 +183,18 @@ def copytree_shutil_walk(src, dst, symlinks=False, ignore=None, copy_function=sh
     errors = []
 
     for root, dirs, files in os.walk(src, topdown=True):
+        # Don't walk excluded folders
+        if ignore is not None:
+            dirs[:] = [x for x in dirs if not ignore(Path(root).joinpath(x))]
+
         for name in files:
             # Set paths
             file_src_path = Path(os.path.join(root, name)).resolve()
-            file_dst_path = Path(dst).resolve().joinpath(file_src_path.relative_to(pb.paths['obsidian_folder']))
+            file_dst_path = Path(dst).resolve().joinpath(file_src_path.relative_to(Path(src).resolve()))
             file_dst_folder_path = file_dst_path.parent
 
-            # Ignore if file is excluded or in an excluded folder (see exclude_subfolders)
-            if should_ignore(ignore, file_src_path):
+            # Ignore if file is excluded (see exclude_glob)
+            if ignore is not None and ignore(Path(root).joinpath(name)):
                 continue
         
             # Get strings of path objects
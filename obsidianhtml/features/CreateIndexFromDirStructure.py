@@ -1,11 +1,9 @@
-import os
 import yaml
-import glob
 
 from pathlib import Path
 from functools import cache
 
-from ..lib import OpenIncludedFile, simpleHash, pushd
+from ..lib import OpenIncludedFile, simpleHash, PathMatcher
 from ..compiler.Templating import PopulateTemplate
 
 
@@ -46,68 +44,46 @@ class CreateIndexFromDirStructure():
         }
 
     def build_exclude_list(self):
-        """ convert possible glob patterns to paths (str) """
-
-        # move to html output dir
-        owd = pushd(self.root)
-
-        # build lists
-        exclude_folders = []
-        for line in self.exclude_subfolders:
-            exclude_folders += glob.glob(line, recursive=True)
-        self.exclude_subfolders_str = list(set(exclude_folders))
-
-        exclude_files = []
-        for line in self.exclude_files:
-            exclude_files += glob.glob(line, recursive=True)
-        self.exclude_files_str = list(set(exclude_files))
+        """ compile the glob patterns (relative to the root folder) """
+        self.exclude_subfolders_matcher = PathMatcher(self.exclude_subfolders, anchored=True)
+        self.exclude_files_matcher = PathMatcher(self.exclude_files, anchored=True)
 
         # print results
         if self.verbose:
-            print(f"\t\tRoot used for glob pattern expansion: {self.root}")
+            print(f"\t\tRoot used for glob pattern matching: {self.root}")
             print("\n\t\tExcluded Folders (configured):")
             print(yaml.dump(self.exclude_subfolders))
             print("\n\t\tExcluded Files (configured):")
             print(yaml.dump(self.exclude_files))
-            print("\n\t\tExcluded Folders (expanded from glob patterns and found):")
-            print(yaml.dump(self.exclude_subfolders_str))
-            print("\n\t\tExcluded Files (expanded from glob patterns and found):")
-            print(yaml.dump(self.exclude_files_str))
-
-        # move back to OG cwd
-        os.chdir(owd)
 
     def build_tree_recurse(self, tree):
         verbose = self.verbose
 
-        for path in Path(tree['path']).resolve().glob('*'):
+        paths = list(Path(tree['path']).resolve().glob('*'))
+        if self.pb.deferred_html is not None:
+            # pages that are still waiting for the second pass are not written to disk yet
+            paths += self.pb.deferred_html.get_unwritten_paths(tree['path'])
+
+        for path in paths:
+            rel_path = path.relative_to(self.root).as_posix()
+            is_dir = path.is_dir()
+
             # Exclude configured subfolders
-            _continue = False
-            for folder in self.exclude_subfolders_str:
-                excl_folder_path = self.root.joinpath(folder)
-                if path.resolve().is_relative_to(excl_folder_path):
-                    if verbose:
-                        print(f'\tExcluded folder {excl_folder_path}: Excluded file {path.name}.')
-                    _continue = True
-                    break
-            if _continue:
+            if self.exclude_subfolders_matcher.match(rel_path, is_dir=is_dir):
+                if verbose:
+                    print(f'\tExcluded folder: Excluded {rel_path}.')
                 continue
 
             # for dir: create a subtree
-            if path.is_dir():
+            if is_dir:
                 new_branch = self.build_tree_recurse(self.get_tree(path))
                 tree['folders'].append(new_branch)
                 continue
 
             # exclude files
-            for ef in self.exclude_files_str:
-                excl_file_path = self.root.joinpath(ef)
-                if excl_file_path == path:
-                    if verbose:
-                        print(f'\tExcluded file {excl_file_path}.')
-                    _continue = True
-                    break
-            if _continue:
+            if self.exclude_files_matcher.match(rel_path):
+                if verbose:
+                    print(f'\tExcluded file {rel_path}.')
                 continue
             
             # set name to graph name if is note
@@ -118,7 +94,7 @@ class CreateIndexFromDirStructure():
                     path_key = path_key.lower()
                 try: # html might be exported and not have a corresponding note
                     fo = self.pb.index.files[path_key]
-                    name = fo.md.GetNodeName()
+                    name = fo.node['name']
                 except:
                     print(path_key, self.pb.index.files.keys())
 
@@ -168,6 +144,8 @@ class CreateIndexFromDirStructure():
             name = f"{settings['naming']}.html"
             
         abs_path = note_folder_abs_path.joinpath(name)
+        if self.pb.deferred_html is not None:
+            return (self.pb.deferred_html.path_exists(abs_path), abs_path)
         return (abs_path.exists(), abs_path)
 
     def check_is_folder_note(self, note_abs_path):
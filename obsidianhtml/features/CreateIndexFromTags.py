@@ -273,7 +273,8 @@ def CreateIndexFromTags(pb):
     fo_index_dst_path = FileObject(pb)
     fo_index_dst_path.init_note_path(index_dst_path)
     fo_index_dst_path.init_markdown_path()
-    pb.index.files[rel_path] = fo_index_dst_path
+    fo_index_dst_path.key = rel_path
+    pb.index.add_file_path(rel_path, fo_index_dst_path)
 
     # [17] Build graph node/links
     if pb.gc('toggles/features/create_index_from_tags/add_links_in_graph_tree', cached=True):
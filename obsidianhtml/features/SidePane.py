@@ -53,9 +53,12 @@ def get_html_page_content(pb, pane_id):
 
     # get file and convert to soup
     fo = pb.index.fo_by_html_relpath[file_rtr]
-    dst_abs_path = fo.path['html']['file_absolute_path']
-    with open(dst_abs_path, 'r', encoding="utf-8") as f:
-        html = f.read()
+    if pb.deferred_html is not None and pb.deferred_html.has(fo):
+        html = pb.deferred_html.get_first_pass_html(fo)
+    else:
+        dst_abs_path = fo.path['html']['file_absolute_path']
+        with open(dst_abs_path, 'r', encoding="utf-8") as f:
+            html = f.read()
 
     soup = BeautifulSoup(html, features="html5lib")
 
@@ -152,28 +152,95 @@ def is_installed(command):
         return False
     return True
 
-def should_ignore(ignore, path):
-    if ignore is None:
-        return False
-
-    for ignore_path in [Path(x).resolve() for x in ignore]:
-        if ignore_path.as_posix() == path.as_posix():
+class PathMatcher:
+    ''' Matches paths against glob patterns, like .gitignore does (e.g. the exclude_glob setting).
+        - A pattern that starts with / only matches from the root folder: /folder
+        - Other patterns match at any depth: folder, *.pdf, folder/subfolder
+          (unless anchored is True, then all patterns match from the root folder, as glob.glob() would)
+        - * and ? do not match /, ** matches any number of folders
+        - A pattern that ends with / only matches folders
+        - When a folder matches, everything in it matches as well
+        The patterns are compiled into one regex, so matching a path does not touch the filesystem (except to check 
+        whether a path is a folder, for patterns that end with /). '''
+    def __init__(self, patterns, anchored=False):
+        self.patterns = [x for x in patterns if x.strip('/') != '']
+
+        flags = re.DOTALL
+        if os.path.normcase('A') == 'a':
+            flags |= re.IGNORECASE
+
+        parts = []          # patterns that match the path or a path in it
+        folder_parts = []   # patterns that only match the path when it is a folder
+        for pattern in self.patterns:
+            prefix = '' if (anchored or pattern[0] == '/') else '(?:.*/)?'
+            regex = prefix + self._translate(pattern.strip('/'))
+            if pattern[-1] == '/':
+                parts.append(regex + '/.*')
+                folder_parts.append(regex)
+            else:
+                parts.append(regex + '(?:/.*)?')
+
+        self.regex = re.compile('(?:' + '|'.join(parts) + ')', flags) if parts else None
+        self.folder_regex = re.compile('(?:' + '|'.join(folder_parts) + ')', flags) if folder_parts else None
+
+    def _translate(self, pattern):
+        regex = ''
+        segments = pattern.split('/')
+        for i, segment in enumerate(segments):
+            last = (i == len(segments) - 1)
+            if segment == '**':
+                regex += '.*' if last else '(?:.*/)?'
+                continue
+
+            j = 0
+            while j < len(segment):
+                char = segment[j]
+                j += 1
+                if char == '*':
+                    regex += '[^/]*'
+                elif char == '?':
+                    regex += '[^/]'
+                elif char == '[':
+                    end = segment.find(']', j + 1 if segment[j:j+1] in ('!', ']') else j)
+                    if end == -1:
+                        regex += re.escape(char)
+                        continue
+                    chars = segment[j:end].replace('\\', '\\\\')
+                    if chars[0] == '!':
+                        chars = '^' + chars[1:]
+                    regex += '[' + chars + ']'
+                    j = end + 1
+                else:
+                    regex += re.escape(char)
+            if not last:
+                regex += '/'
+        return regex
+
+    def match(self, rel_path, is_dir=False):
+        ''' Whether the path (relative to the root folder, posix format) or one of its parent folders matches '''
+        if self.regex is not None and self.regex.fullmatch(rel_path):
             return True
-        if ignore_path.is_dir() and path.is_relative_to(ignore_path):
+        if self.folder_regex is not None and is_dir and self.folder_regex.fullmatch(rel_path):
             return True
+        return False
 
-    return False
+    def match_path(self, path, root):
+        ''' Same as match(), for absolute paths. Paths outside of the root folder never match. '''
+        try:
+            rel_path = Path(path).relative_to(root).as_posix()
+        except ValueError:
+            return False
+        if rel_path == '.':
+            return False
+        if self.regex is not None and self.regex.fullmatch(rel_path):
+            return True
+        return self.folder_regex is not None and self.folder_regex.fullmatch(rel_path) is not None and Path(path).is_dir()
 
 
 class YamlIndentDumper(yaml.Dumper):
     def increase_indent(self, flow=False, indentless=False):
         return super(YamlIndentDumper, self).increase_indent(flow, False)
 
-def pushd(path):
-    cwd = os.getcwd()
-    os.chdir(path)
-    return cwd
-
 def fetch_str(command):
     if isinstance(command, str):
         command = command.split(' ')
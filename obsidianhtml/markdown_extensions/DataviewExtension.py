@@ -103,7 +103,8 @@ class DataviewPreprocessor(Preprocessor):
             return
 
         # get note contents and convert to soup
-        note_path = self.extension.getConfig('note_path')
+        # the same markdown instance can be used for multiple notes, in that case the note path is set on the instance for every note
+        note_path = getattr(self.md, 'note_path', None) or self.extension.getConfig('note_path')
         dataview_export_folder = self.extension.getConfig('dataview_export_folder')
         path = Path(f'{dataview_export_folder}/{note_path}').with_suffix('.md.html')
         print(path)
@@ -18,6 +18,8 @@ import copy
 import xml.etree.ElementTree as etree
 import base64
 
+from ..parser.CodeSections import mask_code_sections, restore_code_sections
+
 FN_BACKLINK_TEXT = util.STX + "zz1337820767766393qq" + util.ETX
 NBSP_PLACEHOLDER = util.STX + "qq3936677670287331zz" + util.ETX
 RE_REF_ID = re.compile(r'(fnref)(\d+)')
@@ -100,6 +102,7 @@ class FootnoteExtension(Extension):
         self.unique_prefix += 1
         self.found_refs = {}
         self.used_refs = set()
+        self.inc = 0
 
     def unique_ref(self, reference, found=False):
         """ Get a unique reference if there are duplicates. """
@@ -142,25 +145,12 @@ class FootnoteExtension(Extension):
 
     def StripCodeSections(self, block):
         """(Temporarily) Remove codeblocks/-lines so that they are not altered in all the conversions. Placeholders are inserted."""
-
-        self.codeblocks = re.findall("^```([\s\S]*?)```[\s]*?$", block, re.MULTILINE)
-        for i, match in enumerate(self.codeblocks):
-            block = block.replace("```"+match+"```", f'%%%codeblock-placeholder-{i}%%%')
-            
-        self.codelines = re.findall("`(.*?)`", block)
-        for i, match in enumerate(self.codelines):
-            block = block.replace("`"+match+"`", f'%%%codeline-placeholder-{i}%%%')
-
+        block, self.codeblocks, self.codelines = mask_code_sections(block)
         return block
 
     def RestoreCodeSections(self, block):
         """Undo the action of StripCodeSections."""
-        for i, value in enumerate(self.codeblocks):
-            block = block.replace(f'%%%codeblock-placeholder-{i}%%%', f"```{value}```\n")
-        for i, value in enumerate(self.codelines):
-            block = block.replace(f'%%%codeline-placeholder-{i}%%%', f"`{value}`")  
-
-        return block
+        return restore_code_sections(block, self.codeblocks, self.codelines)
 
 
     def getId(self):
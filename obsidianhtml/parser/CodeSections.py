@@ -0,0 +1,43 @@
+import re
+
+'''
+Code blocks and code spans should not be altered when a page is converted. Before converting, they are replaced by
+placeholders (mask_code_sections), and afterwards the placeholders are replaced by the code again (restore_code_sections).
+
+Both functions go over the text only once, so that pages with thousands of code spans stay fast.
+'''
+
+# ```code block``` (at the start of a line, closed at the end of a line) or `code span`
+CodeSectionRegex = re.compile(r'^```([\s\S]*?)```(?=[^\S\n]*$)|`([^`\n]*)`', re.MULTILINE)
+PlaceholderRegex = re.compile(r'%%%code(block|line)-placeholder-(\d+)%%%')
+
+def mask_code_sections(text):
+    ''' Returns the text with the code blocks and code spans replaced by placeholders, and the lists of code blocks and code spans (to restore them with) '''
+    codeblocks = []
+    codelines = []
+    parts = []
+    pos = 0
+    for m in CodeSectionRegex.finditer(text):
+        parts.append(text[pos:m.start()])
+        if m.group(1) is not None:
+            parts.append(f'%%%codeblock-placeholder-{len(codeblocks)}%%%')
+            codeblocks.append(m.group(1))
+        else:
+            parts.append(f'%%%codeline-placeholder-{len(codelines)}%%%')
+            codelines.append(m.group(2))
+        pos = m.end()
+    parts.append(text[pos:])
+    return ''.join(parts), codeblocks, codelines
+
+def restore_code_sections(text, codeblocks, codelines):
+    ''' Undoes mask_code_sections(). Note that a newline is added after every code block. '''
+    def restore(m):
+        i = int(m.group(2))
+        if m.group(1) == 'block':
+            if i < len(codeblocks):
+                return f"```{codeblocks[i]}```\n"
+        elif i < len(codelines):
+            return f"`{codelines[i]}`"
+        return m.group(0)
+
+    return PlaceholderRegex.sub(restore, text)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 import re                   # regex string finding/replacing
+import copy
 import yaml
 from pathlib import Path    # 
 import frontmatter          # remove yaml frontmatter from md files
@@ -9,7 +10,38 @@ import warnings
 from ..core.FileFinder import GetObsidianFilePath, FindFile
 from ..lib import DuplicateFileNameInRoot, slugify, MalformedTags, OpenIncludedFile
 
-from .HeaderTree import PrintHeaderTree, ConvertMarkdownToHeaderTree, GetReferencedBlock, GetSubHeaderTree
+from .CodeSections import mask_code_sections, restore_code_sections
+from .ObsidianTokenizer import tokenize, NEWLINE, CODE_BLOCK, EMBED, IMAGE, LINK, WIKILINK, URL, TAG, BLOCK_REF
+
+# Patterns used by prepare_markdown_page_for_html()
+MarkdownLinkRegex = re.compile(r'\]\(([^\s\]]+)\)')                  # [name](link)
+BareUrlRegex = re.compile(r'(?<![\[\(\"])https*:\/\/.[^\s|\"]*(?!.*\">)')
+
+def replace_literals(page, literals, replace, lookbehind=''):
+    ''' Replaces every occurrence of the given strings with replace(string), in one pass. 
+        Where multiple strings match at the same position, the one that comes first in the list wins, as if they were replaced one after the other. '''
+    literals = list(dict.fromkeys(literals))
+    if len(literals) == 0:
+        return page
+    pattern = re.compile(lookbehind + '(?:' + '|'.join([re.escape(x) for x in literals]) + ')')
+    return pattern.sub(lambda m: replace(m.group(0)), page)
+
+
+class CYAMLHandler(frontmatter.YAMLHandler):
+    ''' Parses the frontmatter yaml with libyaml, which is a lot faster than the pure python parser '''
+    def load(self, fm, **kwargs):
+        try:
+            return super().load(fm, Loader=yaml.CSafeLoader, **kwargs)
+        except yaml.YAMLError:
+            # let the pure python parser raise the error, so that the errors stay the same
+            return super().load(fm, **kwargs)
+
+def parse_frontmatter(text):
+    ''' Same as frontmatter.parse(), but parses yaml frontmatter with libyaml when it is available '''
+    handler = frontmatter.detect_format(text.strip(), frontmatter.handlers)
+    if isinstance(handler, frontmatter.YAMLHandler) and yaml.__with_libyaml__:
+        handler = CYAMLHandler()
+    return frontmatter.parse(text, handler=handler)
 
 
 class MarkdownPage:
@@ -18,6 +50,7 @@ class MarkdownPage:
     codeblocks = None       # used to safely store ```codeblock content
     codelines = None        # Used to safely store `codeline` content
     links = None            # Used to recurse to any page linked to by this page
+    included_files = None   # Keys of the notes that are included in this page (recursively), used for incremental builds
 
     src_path  = None        # Path() object of src file
     rel_src_path  = None    # Path() object relative to given markdown root folder (src_folder_path)
@@ -38,12 +71,19 @@ class MarkdownPage:
         self.input_type = input_type
 
         self.links = []
+        self.included_files = []
         self.codeblocks = []
         self.codelines = []
         
         # Load contents of entrypoint and strip frontmatter yaml.
-        with open(self.src_path, encoding="utf-8") as f:
-            self.metadata, self.page = frontmatter.parse(f.read())
+        # (fused pipeline) notes that were converted in this run are handed over in memory instead
+        if input_type == 'markdown' and fo.converted_md is not None:
+            self.metadata = copy.deepcopy(fo.converted_md['metadata'])
+            self.page = fo.converted_md['page']
+        else:
+            # notes are parsed once, and shared by everything that loads them (see Index.parse_note())
+            metadata, self.page = self.pb.index.parse_note(self.src_path)
+            self.metadata = copy.deepcopy(metadata)
 
         self.SanitizeFrontmatter()
         self.GetInlineTags()
@@ -71,8 +111,14 @@ class MarkdownPage:
         # get inline tags
         inline_tags = [x[1:].replace('.','') for x in re.findall("(?<!\S)#[^\s#`]+(?!.*\">)", self.page)] #(?<!\S)#[^\s#`]+
 
-        # merge, and remove duplicates
-        self.metadata['tags'] = list(set(frontmatter_tags + inline_tags))
+        # merge, and remove duplicates (keeping the order, so that the output is the same for every build)
+        self.metadata['tags'] = list(dict.fromkeys(frontmatter_tags + inline_tags))
+
+    def release(self):
+        '''Drops the contents of the page once it has been converted. Only the metadata is used after that (e.g. in the second pass).'''
+        self.page = None
+        self.codeblocks = None
+        self.codelines = None
 
     def HasTag(self, ttag):
         tags = self.metadata['tags']
@@ -107,20 +153,11 @@ class MarkdownPage:
 
     def StripCodeSections(self):
         """(Temporarily) Remove codeblocks/-lines so that they are not altered in all the conversions. Placeholders are inserted."""
-        self.codeblocks = re.findall("^```([\s\S]*?)```[\s]*?$", self.page, re.MULTILINE)
-        for i, match in enumerate(self.codeblocks):
-            self.page = self.page.replace("```"+match+"```", f'%%%codeblock-placeholder-{i}%%%')
-            
-        self.codelines = re.findall("`(.*?)`", self.page)
-        for i, match in enumerate(self.codelines):
-            self.page = self.page.replace("`"+match+"`", f'%%%codeline-placeholder-{i}%%%')
-           
+        self.page, self.codeblocks, self.codelines = mask_code_sections(self.page)
+
     def RestoreCodeSections(self):
         """Undo the action of StripCodeSections."""
-        for i, value in enumerate(self.codeblocks):
-            self.page = self.page.replace(f'%%%codeblock-placeholder-{i}%%%', f"```{value}```\n")
-        for i, value in enumerate(self.codelines):
-            self.page = self.page.replace(f'%%%codeline-placeholder-{i}%%%', f"`{value}`")  
+        self.page = restore_code_sections(self.page, self.codeblocks, self.codelines)
 
     def add_tag(self, tag):
         if 'tags' not in self.metadata:
@@ -188,7 +225,8 @@ class MarkdownPage:
         return f'<embed src="{relative_path_corrected}" width="90%" height="700px">'
 
     def ConvertObsidianPageToMarkdownPage(self, origin:'OH_file'=None, include_depth=0, includer_page_depth=None, remove_block_references=True):
-        """Full subroutine converting the Obsidian Code to proper markdown. Linked files are copied over to the destination folder."""
+        """Full subroutine converting the Obsidian Code to proper markdown. Linked files are copied over to the destination folder.
+           The page is split up into tokens (see ObsidianTokenizer), every token is converted by its handler below, and the result is joined together again."""
 
         # -- Set origin (calling page), this will always be self.fo unless origin is passed in
         if origin is None:
@@ -203,56 +241,31 @@ class MarkdownPage:
             if self.fo.metadata['is_entrypoint']:
                 page_folder_depth = 0
 
-        # -- [??] Remove spaces in front of codeblock open and close lines
-        # Obisidian allows spaces in front, markdown does not
-        self.page = re.sub(r'(^ *```)', '```', self.page, flags=re.MULTILINE)
-
-        # -- [1] Replace code blocks with placeholders so they aren't altered
-        # They will be restored at the end
-        self.StripCodeSections() 
-
-        # -- [??] Insert extra newline between two centered mathjax blocks
-        self.page = re.sub(r'\$\$\ *\n\$\$', '$$ \n\n$$', self.page, flags=re.MULTILINE)
-
-        # -- [??] Replace \| with |
-        self.page = re.sub(r'\\\|', '|', self.page, flags=re.MULTILINE)
-
-        # -- [2] Add newline between paragraph and lists
-        buffer = ''
-        prev_is_list_line = False
-        for i, line in enumerate(self.page.split('\n')):
-            current_is_list_line = False
-            clean_line = line.strip()
-            if len(clean_line) == 0:
-                current_is_list_line = False
-            elif clean_line[0] == '-':
-                current_is_list_line = True
-            if current_is_list_line and (prev_is_list_line == False):
-                buffer += '\n'
-            buffer += '\n' + line
-            prev_is_list_line = current_is_list_line
-        self.page = buffer
-
-        # -- [?] Remove whitespace in front of header hashtags
-        self.page = re.sub('(^\ [\ ]*)(?=#)', '', self.page, flags=re.MULTILINE)
-
-        # -- [3] Convert Obsidian type img links to proper md image links
-        # Further conversion will be done in the block below
-        for link in re.findall("(?<=\!\[\[)(.*?)(?=\])", self.page):
-            print("[3]", link)
-            new_link = '![]('+urllib.parse.quote(link)+')'
+        # -- [7] Fix newline issue by adding three spaces before any newline
+        newline = '\n'
+        if not self.pb.gc('toggles/strict_line_breaks'):
+            newline = '   \n'
+
+        # The linked notes are added to self.links per type of link, in this order
+        md_links = []
+        wiki_links = []
+        inclusion_links = []
+
+        # -- [3] Obsidian type embeds: images are converted to proper md image links, notes are included
+        def convert_embed(token):
+            link = token.match.group('embed_link')
 
             # Obsidian page inclusions use the same tag...
-            # Skip if we don't match image suffixes. Inclusions are handled at the end.
             if len(link.split('.')) == 1 or link.split('.')[-1].split('|')[0].lower() not in self.pb.gc('included_file_suffixes', cached=True):
-                new_link = f'<inclusion href="{link}" />'
+                return include_note(link)
 
-            safe_link = re.escape('![['+link+']]')
-            self.page = re.sub(safe_link, new_link, self.page)
+            return convert_image_link(urllib.parse.quote(link))
 
         # -- [4] Handle local image/video/audio links (copy them over to output)
-        for link in re.findall("(?<=\!\[\]\()(.*?)(?=\))", self.page):
-            print("[4]", link)
+        def convert_image(token):
+            return convert_image_link(token.match.group('image_link'))
+
+        def convert_image_link(link):
             unq_link = urllib.parse.unquote(link)
             
             #clean_link_name = urllib.parse.unquote(link).split('/')[-1].split('|')[0]
@@ -267,7 +280,7 @@ class MarkdownPage:
                         print("\t\t\t<continued> The link seems to be external (contains ://)")
                     else:
                         print(f"\t\t\t<continued> The link was not found in the file tree. Clean links in the file tree are: {', '.join(self.file_tree.keys())}")
-                continue
+                return '![](' + link + ')'
 
             # Get shorthand info
             suffix = lo.path['note']['suffix']
@@ -291,52 +304,49 @@ class MarkdownPage:
                 new_link = self.GetEmbeddable(file_name, relative_path, suffix)
             elif len(unq_link.split('|')) > 1:
                 new_link = f'<img src="{urllib.parse.quote(relative_path)}"  width="{unq_link.split("|")[-1]}">'
-
-            safe_link = re.escape('![]('+link+')')
-            self.page = re.sub(safe_link, new_link, self.page)
+            return new_link.replace('\n', newline)
 
         # -- [5] Change file name in proper markdown links to path
         # And while we are busy, change the path to point to the full relative path
-        proper_links = re.findall(r'(?<=\]\()[^\s\]]+(?=\))', self.page)
-        for l in proper_links:
-            print("[5]", l)
+        def convert_markdown_link(token):
+            l = token.match.group('link_url')
             # There is currently no way to match links containing parentheses, AND not matching the last ) in a link like ([test](link))
+            closing = ''
             if l.endswith(')'):
                 l = l[:-1]
+                closing = ')'
 
             # Get the filename
             link = urllib.parse.unquote(l)
+            if link.startswith('#'):
+                return token.text
+
+            res = GetObsidianFilePath(link, self.file_tree, self.pb)
+            rel_path_str = res['rtr_path_str']
+            lo = res['fo']
+            if lo == False:
+                return token.text
+
+            # Determine if file is markdown
+            isMd = (Path(rel_path_str).suffix == '.md')
+            if isMd:
+                # Add to list to recurse to the link later
+                md_links.append(lo)
+            else:
+                # Copy file over to new location
+                lo.copy_file('ntm')
 
-            if not link.startswith('#'):
-                res = GetObsidianFilePath(link, self.file_tree, self.pb)
-                rel_path_str = res['rtr_path_str']
-                lo = res['fo']
-                if lo == False:
-                    continue
-
-                # Determine if file is markdown
-                isMd = (Path(rel_path_str).suffix == '.md')
-                if isMd:
-                    # Add to list to recurse to the link later
-                    self.links.append(lo)
-
-                # Get file info
-                file_link = lo.get_link('markdown', origin=origin)
-
-                # Update link
-                new_link = ']('+urllib.parse.quote(file_link)+')'
-                safe_link = re.escape(']('+l+')')
-                self.page = re.sub(f"(?<![\[\(])({safe_link})", new_link, self.page)
-
-                if isMd == False:
-                    # Copy file over to new location
-                    lo.copy_file('ntm')
+            # Update link, unless it is a link like [](link)
+            start = token.match.start()
+            if start > 0 and token.match.string[start - 1] in '[(':
+                return token.text
+            file_link = lo.get_link('markdown', origin=origin)
+            return ']('+urllib.parse.quote(file_link)+')' + closing
 
         # -- [6] Replace Obsidian links with proper markdown
         # This is any string in between [[ and ]], e.g. [[My Note]]
-        md_links = re.findall("(?<=\[\[).+?(?=\])", self.page)
-        for l in md_links:
-            print("[6]", l)
+        def convert_wikilink(token):
+            l = token.match.group('wikilink_link')
             # A link in Obsidian can have the format 'filename|alias'
             # If a link does not have an alias, the link name will function as the alias.
             parts = l.split('|')
@@ -355,129 +365,162 @@ class MarkdownPage:
                 hashpart = parts[1]
 
             # Case: hashpart exists, filename is empty --> anchor link
-            is_anchor = False
             if hashpart != '' and filename == '':
-                is_anchor = True
+                return f"[{hashpart}](#{slugify(hashpart)})"
 
-            if is_anchor == False:
-                # find link in filetree
-                res = GetObsidianFilePath(l, self.file_tree, self.pb)
-                rel_path_str = res['rtr_path_str']
-                fo = res['fo']
+            # find link in filetree
+            res = GetObsidianFilePath(l, self.file_tree, self.pb)
+            rel_path_str = res['rtr_path_str']
+            fo = res['fo']
 
-                if rel_path_str == False:
-                    link = '/not_created.md'
-                else:
-                    link = fo.get_link('markdown', origin=origin)
-                    if not fo.metadata['is_note']:
-                        fo.copy_file('ntm')
-                    else:
-                        self.links.append(fo)
-                newlink = urllib.parse.quote(link)
-
-                if hashpart != '':
-                    hashpart = hashpart.replace(' ', '-').lower()
-                    newlink += f'#{hashpart}'
+            if rel_path_str == False:
+                link = '/not_created.md'
             else:
-                newlink = '#' + slugify(hashpart)
-                alias = hashpart
-
-            # Replace Obsidian link with proper markdown link
-            self.page = self.page.replace('[['+l+']]', f"[{alias}]({newlink})")
+                link = fo.get_link('markdown', origin=origin)
+                if not fo.metadata['is_note']:
+                    fo.copy_file('ntm')
+                else:
+                    wiki_links.append(fo)
+            newlink = urllib.parse.quote(link)
 
+            if hashpart != '':
+                hashpart = hashpart.replace(' ', '-').lower()
+                newlink += f'#{hashpart}'
 
-        # -- [7] Fix newline issue by adding three spaces before any newline
-        if not self.pb.gc('toggles/strict_line_breaks'):
-            self.page = self.page.replace("\n", "   \n")
+            return f"[{alias}]({newlink})"
 
         # -- [8] Insert markdown links for bare http(s) links (those without the [name](link) format).
-        # Cannot start with [, (, nor "
-        # match 'http://* ' or 'https://* ' (end match by whitespace)
-        for l in re.findall("(?<![\[\(\"])https*:\/\/.[^\s|\"]*(?!.*\">)", self.page):  
-            print("[8]", l)
-            new_md_link = f"[{l}]({l})"
-            safe_link = re.escape(l)
-            self.page = re.sub(f"(?<![\[\(])({safe_link})", new_md_link, self.page)
+        def convert_url(token):
+            return f"[{token.text}]({token.text})"
 
         # -- [9] Remove inline tags, like #ThisIsATag
         # Inline tags are # connected to text (so no whitespace nor another #)
-        for l in re.findall("(?<!\S)#[^\s#`]+(?!.+<\/iframe>)", self.page):
-            print("[9]", l)
-            tag = l.replace('.', '').replace('#', '')
-            new_md_str = f"**{tag}**"
+        def convert_tag(token):
+            tag = token.text.replace('.', '').replace('#', '')
+            self.add_tag(tag)
 
             if self.pb.gc('toggles/preserve_inline_tags', cached=True):
-                new_md_str = "`{_obsidian_pattern_tag_" + tag + "}`"
+                return "`{_obsidian_pattern_tag_" + tag + "}`"
+            return f"**{tag}**"
 
-            self.add_tag(tag)
-
-            safe_str = re.escape(l)
-            self.page = re.sub(safe_str, new_md_str, self.page)
-            
-        # -- [10] Add code inclusions
-        for l in re.findall(r'(\<inclusion href="[^"]*" />)', self.page, re.MULTILINE):
-            print("[610]", l)
-            link = l.replace('<inclusion href="', '').replace('" />', '')
+        # -- [#296] Remove block references 
+        def convert_block_ref(token):
+            if remove_block_references:
+                return ''
+            return token.text
 
+        # -- [10] Add note inclusions
+        def include_note(link):
             result = GetObsidianFilePath(link, self.file_tree, self.pb)
             file_object = result['fo']
             header =  result['header']
 
-
             if file_object == False:
-                self.page = self.page.replace(l, f"> **Obsidian-html erreur:** La page {link} n'existe pas.")
-                continue
+                return f"> **Obsidian-html erreur:** La page {link} n'existe pas."
             
-            self.links.append(file_object)
+            inclusion_links.append(file_object)
 
             if include_depth > 3:
                 link_path = file_object.get_link('markdown', origin=origin)
-                self.page = self.page.replace(l, f"[{link}]({link_path}).")
-                continue
+                return f"[{link}]({link_path})."
 
-            incl_page_path = file_object.path['note']['file_absolute_path']
             if not file_object.is_valid_note('note'):
-                self.page = self.page.replace(l, f"> **obsidian-html error:** Error including file or not a markdown file {link}.")
-                continue
+                return f"> **obsidian-html error:** Error including file or not a markdown file {link}."
             
+            # Every distinct inclusion is only converted once per build
+            cache = self.pb.transclusion_cache
+            if cache is None:
+                page, included_files = convert_inclusion(link, file_object, header)
+            else:
+                key = cache.get_key(file_object, (link.split('#')[0], header), include_depth, page_folder_depth, self.fo)
+                entry = cache.get(key)
+                if entry is None:
+                    # keep track of the attachments that are copied while converting, to attribute them to the notes that hit the cache
+                    manifest = self.pb.manifest
+                    if manifest is not None:
+                        pending_copies, manifest.pending_copies = manifest.pending_copies, set()
+                    page, included_files = convert_inclusion(link, file_object, header)
+                    copied_files = []
+                    if manifest is not None:
+                        copied_files = list(manifest.pending_copies)
+                        manifest.pending_copies |= pending_copies
+                    cache.store(key, page, included_files, copied_files)
+                else:
+                    page, included_files, copied_files = entry
+                    if self.pb.manifest is not None:
+                        for copied_key in copied_files:
+                            self.pb.manifest.add_copy(self.file_tree[copied_key], 'ntm')
+
+            self.included_files += [file_object.key] + included_files
+
+            # [425] Add included references as links in graph view
+            # add link to frontmatter yaml so that we can add it to the graphview
+            if self.pb.gc('toggles/features/graph/show_inclusions_in_graph'):
+                self.AddInclusionLink(result['rtr_path_str'])
+
+            return '\n' + page + '\n'
+
+        def convert_inclusion(link, file_object, header):
+            ''' Returns the markdown to include, and the keys of the notes that are included in it '''
             # Get code
-            #included_page = MarkdownPage(self.pb, file_object, 'note', self.file_tree)
-            included_page = file_object.load_markdown_page('note')
-            included_page.ConvertObsidianPageToMarkdownPage(origin=self.fo, include_depth=include_depth + 1, includer_page_depth=page_folder_depth, remove_block_references=False)
+            # Block references are kept when a block is included, to be able to find the block
+            included_page = MarkdownPage(file_object, 'note')
+            included_page.ConvertObsidianPageToMarkdownPage(origin=self.fo, include_depth=include_depth + 1, includer_page_depth=page_folder_depth, remove_block_references=(header[:1] != '^'))
 
             # Get subsection of code if header is present
             if header != '': 
                 # Prepare document
                 included_page.StripCodeSections()
+                section_index = file_object.get_section_index(included_page.page)
 
                 # option: Referencing block
                 if header[0] == '^':
-                    included_page.page = GetReferencedBlock(header, included_page.page, included_page.rel_src_path.as_posix())
+                    included_page.page = section_index.get_block(header, included_page.rel_src_path.as_posix())
 
                 # option: Referencing header
                 else:
-                    header_dict, root_element = ConvertMarkdownToHeaderTree(included_page.page)
-                    header_tree = GetSubHeaderTree(root_element, header)
-                    if header_tree == False:
+                    section = section_index.get_section(header)
+                    if section == False:
                         included_page.page = f"Obsidianhtml: Error: Unable to find section #{header} in {link.split('#')[0]}"
                     else:
-                        included_page.page = PrintHeaderTree(header_tree)
+                        included_page.page = section
 
                 # Wrap up
                 included_page.RestoreCodeSections()
-            
-            self.page = self.page.replace(l, '\n' + included_page.page + '\n')
 
-            # [425] Add included references as links in graph view
-            # add link to frontmatter yaml so that we can add it to the graphview
-            if self.pb.gc('toggles/features/graph/show_inclusions_in_graph'):
-                self.AddInclusionLink(result['rtr_path_str'])
+            return included_page.page, included_page.included_files
+
+        handlers = {
+            NEWLINE: lambda token: newline,
+            CODE_BLOCK: lambda token: token.text + '\n',
+            EMBED: convert_embed,
+            IMAGE: convert_image,
+            LINK: convert_markdown_link,
+            WIKILINK: convert_wikilink,
+            URL: convert_url,
+            TAG: convert_tag,
+            BLOCK_REF: convert_block_ref,
+        }
 
-        # -- [#296] Remove block references 
-        if remove_block_references:
-            self.page  = re.sub(r'(?<=\s)(\^\S*?)(?=$|\n)', '', self.page)
+        output = []
+        for token in tokenize(self.page):
+            handler = handlers.get(token.type)
+            output.append(token.text if handler is None else handler(token))
+        self.page = ''.join(output)
 
-        # -- [1] Restore codeblocks/-lines
-        self.RestoreCodeSections()
+        self.links += md_links + wiki_links + inclusion_links
 
         return self
+
+def SortMetadata(value):
+    '''Returns a copy of the metadata with the keys sorted, as they are after writing the frontmatter yaml and reading it back in.'''
+    if isinstance(value, dict):
+        keys = list(value.keys())
+        try:
+            keys = sorted(keys)
+        except TypeError:
+            pass
+        return {k: SortMetadata(value[k]) for k in keys}
+    if isinstance(value, (list, tuple)):
+        return [SortMetadata(x) for x in value]
+    return value
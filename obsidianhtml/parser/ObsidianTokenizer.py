@@ -0,0 +1,143 @@
+import re
+
+'''
+Splits an Obsidian markdown page into tokens, used by MarkdownPage.ConvertObsidianPageToMarkdownPage().
+
+The page is read once, line by line. Code blocks and code spans become tokens of their own, so that they are never
+altered. The rest of a line is split up into links, embeds, bare urls, inline tags, block references and the plain
+text in between. The handlers in ConvertObsidianPageToMarkdownPage() rewrite these tokens, after which the page is
+joined together again in one go.
+
+A few fixes that are needed to go from Obsidian markdown to proper markdown are done while tokenizing, see tokenize().
+'''
+
+# Token types
+TEXT = 'text'
+NEWLINE = 'newline'
+CODE_BLOCK = 'code_block'       # ```code```
+CODE_SPAN = 'code_span'         # `code`
+EMBED = 'embed'                 # ![[file]]
+IMAGE = 'image'                 # ![](file)
+LINK = 'link'                   # the ](link) part of [name](link)
+WIKILINK = 'wikilink'           # [[note]]
+URL = 'url'                     # bare http(s) links, without the [name](link) format
+TAG = 'tag'                     # #tag
+BLOCK_REF = 'block_ref'         # ^block-id at the end of a line
+
+# Everything that is rewritten within a line. The group names are the token types.
+InlineTokenRegex = re.compile(
+    r'(?P<code_span>`[^`\n]*`)'
+    r'|(?P<embed>!\[\[(?P<embed_link>[^\]\n]*)\]\])'
+    r'|(?P<image>!\[\]\((?P<image_link>[^)\n]*)\))'
+    r'|(?P<link>\]\((?P<link_url>[^\s\]]+)\))'
+    r'|(?P<wikilink>\[\[(?P<wikilink_link>.[^\]\n]*)\]\])'
+    r'|(?P<url>(?<![\[\(\"])https*:\/\/.[^\s|\"`]*(?!.*\">))'    # cannot start with [, ( nor " and cannot be in an html tag
+    r'|(?P<tag>(?<!\S)#[^\s#`]+(?!.+<\/iframe>))'                # no whitespace nor another # in a tag
+    r'|(?P<block_ref>(?<!\S)\^\S*$)'
+)
+CodeFenceRegex = re.compile(r' *```')
+CodeFenceCloseRegex = re.compile(r'```([^\S\n]*)$')
+EscapedPipeRegex = re.compile(r'`[^`\n]*`|\\\|')
+
+class Token:
+    __slots__ = ('type', 'text', 'match')
+
+    def __init__(self, type, text, match=None):
+        self.type = type
+        self.text = text
+        self.match = match      # the re.Match of the inline tokens, to get to the link etc.
+
+    def __repr__(self):
+        return f'Token({self.type}, {self.text!r})'
+
+def tokenize(page):
+    ''' Yields the tokens of the page. Every line is preceded by a newline token (so the page starts with an empty line).
+        While tokenizing:
+        - Spaces in front of code fences and in front of header hashtags are removed
+        - \\| is replaced by | (outside of code)
+        - An empty line is inserted between a paragraph and a list, and between two centered mathjax blocks ($$\\n$$)
+    '''
+    lines = page.split('\n')
+    prev_is_list_line = False
+    math_consumed = False       # whether the $$ at the start of this line closed the mathjax block on the previous line
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+
+        # Code block
+        if CodeFenceRegex.match(line):
+            line = line.lstrip(' ')
+            block = read_code_block(lines, i)
+            if block is not None:
+                code, trailing, i = block
+                yield Token(NEWLINE, '\n')
+                yield Token(CODE_BLOCK, code)
+                if trailing != '':
+                    yield Token(TEXT, trailing)
+                prev_is_list_line = False
+                math_consumed = False
+                i += 1
+                continue
+
+        # Remove whitespace in front of header hashtags
+        if line.startswith(' ') and line.lstrip(' ').startswith('#'):
+            line = line.lstrip(' ')
+
+        # Replace \| with |
+        if '\\|' in line:
+            line = EscapedPipeRegex.sub(lambda m: m.group(0) if m.group(0)[0] == '`' else '|', line)
+
+        # Insert extra newline between two centered mathjax blocks
+        split_math = False
+        stripped = line.rstrip(' ')
+        if stripped.endswith('$$') and (not math_consumed or len(stripped) >= 4) and i + 1 < len(lines) and lines[i+1].startswith('$$'):
+            line = stripped + ' '
+            split_math = True
+
+        # Add newline between paragraph and lists
+        clean_line = line.strip()
+        is_list_line = (len(clean_line) > 0 and clean_line[0] == '-')
+        if is_list_line and not prev_is_list_line:
+            yield Token(NEWLINE, '\n')
+        prev_is_list_line = is_list_line
+
+        yield Token(NEWLINE, '\n')
+        yield from tokenize_line(line)
+
+        math_consumed = split_math
+        if split_math:
+            yield Token(NEWLINE, '\n')
+            prev_is_list_line = False
+        i += 1
+
+def tokenize_line(line):
+    pos = 0
+    for m in InlineTokenRegex.finditer(line):
+        if m.start() > pos:
+            yield Token(TEXT, line[pos:m.start()])
+        yield Token(m.lastgroup, m.group(0), m)
+        pos = m.end()
+    if pos < len(line):
+        yield Token(TEXT, line[pos:])
+
+def read_code_block(lines, i):
+    ''' Returns the code block that opens on line i (the code including the fences, the text after the closing fence,
+        the index of the line with the closing fence), or None when the code block is never closed. '''
+    rest = lines[i].lstrip(' ')[3:]
+    m = CodeFenceCloseRegex.search(rest)
+    if m:
+        return ('```' + rest[:m.end() - len(m.group(1))], m.group(1), i)
+
+    code = ['```' + rest]
+    for j in range(i + 1, len(lines)):
+        m = CodeFenceCloseRegex.search(lines[j])
+        if m is None:
+            code.append(lines[j])
+            continue
+        before = lines[j][:m.start()]
+        if before.strip(' ') == '':
+            before = ''
+        code.append(before + '```')
+        return ('\n'.join(code), m.group(1), j)
+    return None
@@ -0,0 +1,186 @@
+import hashlib
+import regex as re
+from ..lib import slugify
+
+'''
+Index of the sections of a note: the headers (with the range of the note that falls under each header) and the
+^block-id references (with the range of the paragraph they belong to).
+
+The index is built in one pass over the note, after which sections and blocks can be looked up without going over the
+note again. It is kept on the FileObject (see FileObject.get_section_index()), and built again when the content changes.
+
+The results are the same as those of the functions in HeaderTree.py:
+    index.get_section('header#subheader')  ==  PrintHeaderTree(GetSubHeaderTree(root_element, 'header#subheader'))
+    index.get_block('^block-id', path)       ==  GetReferencedBlock('^block-id', page, path)
+'''
+
+BlockReferenceRegex = re.compile(r'(?<=\s|^)(\^\S*?)(?=$|\n)')
+
+def hash_text(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def parse_header(line):
+    ''' Returns (level, title) of a line that starts with #. Returns None when no space follows the hashtags, these lines are left out of the sections. '''
+    level = 0
+    for i, char in enumerate(line):
+        if char == '#':
+            level += 1
+        elif char == ' ':
+            return level, line[i+1:]
+    return None
+
+def is_header_line(line):
+    return len(line) >= 2 and line[0] == '#'
+
+
+class Header:
+    __slots__ = ('level', 'title', 'slug', 'start', 'end', 'last')
+
+    def __init__(self, level, title, slug, start):
+        self.level = level
+        self.title = title
+        self.slug = slug
+        self.start = start      # offset of the header line in the note
+        self.end = None         # offset of the end of the section (before the newline)
+        self.last = None        # index of the last header in the section (the header itself when there are no subheaders)
+
+
+class SectionIndex:
+    hash = None             # hash of the text that was indexed
+    text = None
+    headers = None          # [Header], in order of appearance
+    slugs = None            # slug --> index in self.headers. Duplicate titles get a _1, _2 etc suffix
+    blocks = None           # ^block-id --> (start, end) of the paragraph, (start, end) of the paragraph before it (or None)
+
+    def __init__(self, text, text_hash=None):
+        self.hash = text_hash if text_hash is not None else hash_text(text)
+        self.text = text
+        self.headers = []
+        self.slugs = {}
+        self.blocks = {}
+
+        open_headers = []       # headers of which the section has not ended yet
+        paragraph_start = None
+        paragraph_end = None
+        previous_paragraph = None
+        last_line = ''
+
+        pos = 0
+        for line in text.split('\n'):
+            line_end = pos + len(line)
+
+            # Headers
+            if is_header_line(line):
+                header = parse_header(line)
+                if header is not None:
+                    level, title = header
+                    slug = slugify(title)
+                    if slug in self.slugs:
+                        i = 1
+                        while (slug + '_' + str(i)) in self.slugs:
+                            i += 1
+                        slug = slug + '_' + str(i)
+
+                    # the sections of the headers of the same or a higher level end here
+                    while open_headers and open_headers[-1].level >= level:
+                        self.close_header(open_headers.pop(), pos - 1)
+
+                    self.slugs[slug] = len(self.headers)
+                    self.headers.append(Header(level, title, slug, pos))
+                    open_headers.append(self.headers[-1])
+
+            # Paragraphs (separated by empty lines), a ^block-id can be put at the end of the last line of the paragraph
+            if line.strip() == '':
+                self.add_block(last_line, paragraph_start, paragraph_end, previous_paragraph)
+                if paragraph_start is not None and text[paragraph_start:paragraph_end].strip() != '':
+                    previous_paragraph = (paragraph_start, paragraph_end)
+                paragraph_start = None
+                last_line = ''
+            else:
+                if paragraph_start is None:
+                    paragraph_start = pos
+                paragraph_end = line_end
+                last_line = line
+
+            pos = line_end + 1
+
+        while open_headers:
+            self.close_header(open_headers.pop(), len(text))
+        self.add_block(last_line, paragraph_start, paragraph_end, previous_paragraph)
+
+    def close_header(self, header, end):
+        header.end = end
+        header.last = len(self.headers) - 1
+
+    def add_block(self, last_line, start, end, previous_paragraph):
+        reference = last_line.strip().split(' ')[-1]
+        if reference == '' or reference in self.blocks:
+            return
+        paragraph = (start, end) if start is not None else None
+        self.blocks[reference] = (paragraph, previous_paragraph)
+
+    def get_section(self, header_selector):
+        ''' Returns the markdown under the given header, or False when the header does not exist.
+            The header_selector can look like this: section1#h3 (which will be different from section2#h3, for example) '''
+        current = None          # None is the root, i.e. the whole note
+        for header_element in header_selector.split('#'):
+            md_title = slugify(header_element)
+
+            # the header should be (under) the currently selected header
+            if current is None and md_title == '':
+                continue
+            i = self.slugs.get(md_title)
+            if i is None or (current is not None and not (current <= i <= self.headers[current].last)):
+                print(f'ERROR: header with title {md_title} was not found')
+                return False
+            current = i
+
+        if current is None:
+            return self.print_section(0, len(self.text))
+        header = self.headers[current]
+        return self.print_section(header.start, header.end)
+
+    def print_section(self, start, end):
+        ''' Returns the lines of the section. Header lines are cleaned up, and lines with # that are not a header are left out '''
+        lines = []
+        for line in self.text[start:end].split('\n'):
+            if is_header_line(line):
+                header = parse_header(line)
+                if header is None:
+                    continue
+                line = header[0] * '#' + ' ' + header[1]
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def get_block(self, reference, rel_path_str):
+        ''' Returns the paragraph that ends with the given ^block-id (without the ^block-id) '''
+        if reference not in self.blocks:
+            return f"Unable to find section #{reference} in {rel_path_str}"
+
+        paragraph, previous_paragraph = self.blocks[reference]
+        clean_chunk = ''
+        if paragraph is not None:
+            clean_chunk = BlockReferenceRegex.sub('', self.get_paragraph(paragraph).strip())
+        if clean_chunk == '' and previous_paragraph is not None:
+            # the paragraph consists of only the reference, get the paragraph before it
+            clean_chunk = BlockReferenceRegex.sub('', self.get_paragraph(previous_paragraph).strip())
+        return clean_chunk
+
+    def get_paragraph(self, paragraph):
+        start, end = paragraph
+        return self.text[start:end].replace('\n', '')
+
+    def starts_with_h1(self):
+        ''' Whether the first line of the note is a h1 header (lines with # that are not a header do not count) '''
+        if len(self.headers) == 0 or self.headers[0].level != 1:
+            return False
+        first_lines = self.text[:self.headers[0].start].split('\n')[:-1]
+        return all(is_header_line(line) and parse_header(line) is None for line in first_lines)
+
+    def find_h1_line_end(self):
+        ''' Returns the offset of the end of the first line that starts with '# ', or None '''
+        for header in self.headers:
+            if self.text.startswith('# ', header.start):
+                line_end = self.text.find('\n', header.start)
+                return len(self.text) if line_end == -1 else line_end
+        return None
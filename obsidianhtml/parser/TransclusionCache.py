@@ -0,0 +1,37 @@
+import hashlib
+
+'''
+Notes that are included in a lot of other notes (![[note]], ![[note#header]], ![[note#^block-id]]) would be converted
+again for every inclusion. The TransclusionCache keeps the result of including a note, so that every distinct inclusion
+is only converted once per build (see include_note() in MarkdownPage.ConvertObsidianPageToMarkdownPage()).
+
+An inclusion is the same when it is the same file with the same content, the same header/block is selected, and the
+including note is in a position that yields the same links: same inclusion depth, same page depth (for image links),
+and same folder depth (for relative note links).
+'''
+
+class TransclusionCache:
+    entries = None          # key --> result of the inclusion
+    hits = 0
+    misses = 0
+
+    def __init__(self):
+        self.entries = {}
+
+    def get_key(self, fo, selector, include_depth, page_folder_depth, origin):
+        with open(fo.path['note']['file_absolute_path'], 'rb') as f:
+            content_hash = hashlib.sha1(f.read()).hexdigest()
+        origin_folder_depth = origin.path['markdown']['file_relative_path'].as_posix().count('/')
+        return (fo.key, content_hash, selector, include_depth, page_folder_depth, origin_folder_depth)
+
+    def get(self, key):
+        ''' Returns (page, included_files, copied_files) of the inclusion, or None when it was not converted before '''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def store(self, key, page, included_files, copied_files):
+        self.entries[key] = (page, included_files, copied_files)